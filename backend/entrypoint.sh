@@ -6,8 +6,17 @@ python3 manage.py makemigrations web_site
 
 python3 manage.py migrate --no-input
 
+python3 manage.py recipe_snapshots
+
+python3 manage.py compute_recipe_scores
+
 python3 manage.py collectstatic --no-input
 
 #python3 manage.py filling_db
 
-gunicorn foodgram.wsgi:application --bind 0.0.0.0:8000
\ No newline at end of file
+# SERVER=asgi - асинхронное чтение рецептов (web_site.async_views)
+if [ "$SERVER" = "asgi" ]; then
+    gunicorn foodgram.asgi:application -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
+else
+    gunicorn foodgram.wsgi:application --bind 0.0.0.0:8000
+fi
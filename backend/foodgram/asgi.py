@@ -12,6 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+# под ASGI чтение рецептов, тегов и ингредиентов идёт через
+# асинхронные вьюхи (web_site.async_views)
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
+# потоки запросов под ASGI не переиспользуют постоянные соединения:
+# они только копились бы до CONN_MAX_AGE, вместо них есть DB_POOL_SIZE
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
 
@@ -0,0 +1,247 @@
+"""PostgreSQL с замером времени получения соединения и пулом соединений
+в процессе.
+
+Время, за которое запрос получил соединение (новое или из пула, вместе с
+ожиданием свободного), попадает в метрики запроса web_site.metrics.
+
+При DATABASES[...]["POOL"]["MAX_SIZE"] > 0 соединения не закрываются, а
+возвращаются в общий для потоков процесса пул. Это нужно прежде всего под
+ASGI: там каждый запрос выполняет синхронный код в своём потоке, и
+постоянные соединения (CONN_MAX_AGE) не переиспользуются. Если все
+MAX_SIZE соединений заняты, запрос ждёт свободное до TIMEOUT секунд, затем
+получает OperationalError. Соединения, простоявшие в пуле дольше MAX_IDLE
+секунд, закрываются, а при CONN_HEALTH_CHECKS соединение из пула перед
+выдачей проверяется запросом SELECT 1.
+
+Пул заводится на алиас и параметры соединения: когда тест-раннер
+переключает NAME на тестовую базу, её соединения попадают в отдельный
+пул. Перед созданием и удалением тестовой базы все пулы алиаса
+закрываются, иначе DROP DATABASE не выполнится из-за открытых
+соединений.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.db.backends.postgresql import base, creation
+from psycopg2 import extensions
+
+from web_site import metrics
+
+logger = logging.getLogger(__name__)
+
+Database = base.Database
+
+
+class ConnectionPool:
+    def __init__(self, connect, max_size, timeout=5, max_idle=300,
+                 health_checks=True):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_checks = health_checks
+        self._idle = deque()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak = 0
+        self.created = 0
+        self.acquired = 0
+        self.waited = 0
+        self.timeouts = 0
+        self.acquire_time = 0.0
+        self.max_acquire_time = 0.0
+
+    def acquire(self):
+        """Соединение и время, за которое оно получено"""
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waited += 1
+            logger.warning(
+                "Все %s соединений пула заняты, запрос ждёт",
+                self.max_size
+            )
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise Database.OperationalError(
+                    f"Нет свободного соединения в пуле за {self.timeout} с"
+                )
+        try:
+            connection = self.get_idle()
+            if connection is None:
+                connection = self.connect()
+                with self._lock:
+                    self.created += 1
+        except BaseException:
+            self._slots.release()
+            raise
+        duration = time.perf_counter() - start
+        with self._lock:
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+            self.acquired += 1
+            self.acquire_time += duration
+            self.max_acquire_time = max(self.max_acquire_time, duration)
+        return connection, duration
+
+    def get_idle(self):
+        # последнее возвращённое соединение - самое "тёплое"
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, released_at = self._idle.pop()
+            if (time.monotonic() - released_at <= self.max_idle
+                    and self.is_usable(connection)):
+                return connection
+            self.discard(connection)
+
+    def is_usable(self, connection):
+        if connection.closed:
+            return False
+        if not self.health_checks:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if not connection.autocommit:
+                connection.rollback()
+        except Database.Error:
+            return False
+        return True
+
+    def release(self, connection, discard=False):
+        try:
+            if discard or connection.closed:
+                self.discard(connection)
+                return
+            try:
+                # незавершённая транзакция не должна достаться
+                # следующему запросу
+                if (connection.get_transaction_status()
+                        != extensions.TRANSACTION_STATUS_IDLE):
+                    connection.rollback()
+            except Database.Error:
+                self.discard(connection)
+                return
+            with self._lock:
+                self._idle.append((connection, time.monotonic()))
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Database.Error:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for connection, _ in idle:
+            self.discard(connection)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": self.in_use,
+                "idle": len(self._idle),
+                "peak": self.peak,
+                "created": self.created,
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "timeouts": self.timeouts,
+                "acquire_ms_mean": round(
+                    self.acquire_time / self.acquired * 1000, 3
+                ) if self.acquired else 0,
+                "acquire_ms_max": round(self.max_acquire_time * 1000, 3),
+            }
+
+
+# пулы процесса по алиасу базы и параметрам соединения
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool_key(alias, conn_params):
+    return alias, repr(sorted(conn_params.items()))
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _create_test_db(self, *args, **kwargs):
+        self.connection.close_pool()
+        return super()._create_test_db(*args, **kwargs)
+
+    def _destroy_test_db(self, *args, **kwargs):
+        self.connection.close_pool()
+        return super()._destroy_test_db(*args, **kwargs)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+    # пул, из которого взято текущее соединение
+    connection_pool = None
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict.get("POOL") or {}
+        if not options.get("MAX_SIZE"):
+            return None
+        key = get_pool_key(self.alias, conn_params)
+        with pools_lock:
+            pool = pools.get(key)
+            if pool is None:
+                pool = pools[key] = ConnectionPool(
+                    lambda: super(DatabaseWrapper, self).get_new_connection(
+                        conn_params
+                    ),
+                    options["MAX_SIZE"],
+                    timeout=options.get("TIMEOUT", 5),
+                    max_idle=options.get("MAX_IDLE", 300),
+                    health_checks=self.settings_dict["CONN_HEALTH_CHECKS"]
+                )
+        return pool
+
+    def get_pool_stats(self):
+        pool = pools.get(
+            get_pool_key(self.alias, self.get_connection_params())
+        )
+        return pool.stats() if pool else None
+
+    def close_pool(self):
+        """Закрывает свободные соединения всех пулов алиаса и удаляет
+        сами пулы"""
+        with pools_lock:
+            keys = [key for key in pools if key[0] == self.alias]
+            closed = [pools.pop(key) for key in keys]
+        for pool in closed:
+            pool.close_all()
+
+    def get_new_connection(self, conn_params):
+        self.connection_pool = self.get_pool(conn_params)
+        if self.connection_pool is None:
+            start = time.perf_counter()
+            connection = super().get_new_connection(conn_params)
+            metrics.record_connect(time.perf_counter() - start)
+            return connection
+        connection, duration = self.connection_pool.acquire()
+        metrics.record_connect(duration)
+        return connection
+
+    def _close(self):
+        pool, self.connection_pool = self.connection_pool, None
+        if pool is None or self.connection is None:
+            return super()._close()
+        # соединение, закрытое внутри atomic, Django ещё считает своим;
+        # пул могли закрыть (close_pool), тогда соединение закроет он сам
+        pool.release(
+            self.connection,
+            discard=self.in_atomic_block or pool not in pools.values()
+        )
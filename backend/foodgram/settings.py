@@ -53,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'web_site.metrics.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,15 +85,29 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('ENGINE',
-                            default='django.db.backends.postgresql'),
+        'ENGINE': os.getenv('ENGINE', default='foodgram.db'),
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        # сколько секунд соединение переиспользуется между запросами,
+        # 0 - новое соединение на каждый запрос
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', default='1') == '1'
+        ),
+        # пул соединений в процессе (foodgram.db), MAX_SIZE 0 - без пула
+        'POOL': {
+            'MAX_SIZE': int(os.getenv('DB_POOL_SIZE', default=0)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=5)),
+            'MAX_IDLE': int(os.getenv('DB_POOL_MAX_IDLE', default=300)),
+        },
     }
 }
+if DATABASES['default']['POOL']['MAX_SIZE']:
+    # с пулом соединение возвращается в него в конце каждого запроса
+    DATABASES['default']['CONN_MAX_AGE'] = 0
 
 SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False
@@ -145,4 +160,109 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Автодополнение ингредиентов (web_site.autocomplete)
+INGREDIENT_INDEX_ENABLED = True
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', default=300))
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_MAX_LIMIT = 100
+
+# Кэш ответов на анонимные GET-запросы (web_site.cache). При заданном
+# REDIS_URL ответы хранятся в Redis (нужен пакет redis) и общие для
+# всех процессов, иначе в памяти каждого процесса.
+RESPONSE_CACHE = {
+    'ENABLED': os.getenv('RESPONSE_CACHE_ENABLED', default='1') == '1',
+    'BACKEND': 'web_site.cache.LocMemBackend',
+    'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=60)),
+    'MAX_ENTRIES': 1000,
+    'ALIAS': 'default',
+}
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+    RESPONSE_CACHE['BACKEND'] = 'web_site.cache.DjangoCacheBackend'
+
+# Наборы id избранного, списка покупок и подписок пользователя
+# (web_site.viewer) кэшируются, только если кэш общий для всех процессов:
+# сигналы, сбрасывающие его, срабатывают только в процессе записи.
+VIEWER_CACHE_TIMEOUT = 300 if os.getenv('REDIS_URL') else 0
+
+# Файлы списка покупок (web_site.shopping_list) по умолчанию кэшируются,
+# как и наборы web_site.viewer, только с REDIS_URL: версию корзины
+# сбрасывают сигналы в процессе записи, и локальный кэш других процессов
+# отдавал бы устаревший файл. Без Redis каждая выгрузка считается заново
+# (один запрос к базе). При одном процессе (один воркер gunicorn) кэш в
+# памяти процесса включается явно: SHOPPING_LIST_CACHE_TIMEOUT=<секунды>
+SHOPPING_LIST_CACHE_TIMEOUT = int(os.getenv(
+    'SHOPPING_LIST_CACHE_TIMEOUT',
+    default=3600 if os.getenv('REDIS_URL') else 0
+))
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Голова ленты подписок (web_site.feed): id первых FEED_HEAD_SIZE + 1
+# рецептов ленты кэшируются по пользователю, тоже только с общим кэшем
+FEED_CACHE_TIMEOUT = 600 if os.getenv('REDIS_URL') else 0
+FEED_HEAD_SIZE = 60
+
+# Рейтинги рецептов для ?ordering=popular|trending (web_site.scores):
+# веса добавления в избранное и в список покупок, период полураспада
+# вклада добавления в trending и окно учитываемых добавлений, в часах
+RECIPE_SCORES = {
+    'FAVORITE_WEIGHT': 1.0,
+    'CART_WEIGHT': 1.0,
+    'HALF_LIFE_HOURS': 72,
+    'WINDOW_HOURS': 30 * 24,
+}
+
+# Уменьшенные копии изображений рецептов (web_site.images)
+RECIPE_IMAGE_ASYNC = True
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+RECIPE_IMAGE_FORMAT = 'WEBP'
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+
+# Загрузка изображений рецептов в base64 (web_site.fields)
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.getenv('IMAGE_UPLOAD_MAX_BYTES', default=10 * 1024 * 1024)
+)
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.getenv('IMAGE_UPLOAD_MAX_PIXELS', default=40_000_000)
+)
+# файл больше этого размера декодируется на диск, а не в память
+IMAGE_UPLOAD_SPOOL_SIZE = 1024 * 1024
+
+# Бюджеты запросов к базе по маршрутам (web_site.metrics): ключ - имя
+# маршрута или "МЕТОД имя", значение - пределы queries, db_ms,
+# serializer_ms, total_ms и size (байт). Пределы queries - худший
+# случай с TokenAuthentication (запрос токена входит в число) плюс один
+# запрос запаса
+QUERY_BUDGETS = {
+    'GET recipes-list': {'queries': 10},
+    'GET recipes-detail': {'queries': 8},
+    'POST recipes-list': {'queries': 19},
+    'PATCH recipes-detail': {'queries': 19},
+    'GET recipes-feed': {'queries': 7},
+    'user-subscriptions': {'queries': 8},
+    'download': {'queries': 3},
+}
+# превышение бюджета - ошибка (тесты включают это через override_settings),
+# иначе запись в лог
+QUERY_BUDGET_RAISE = os.getenv('QUERY_BUDGET_RAISE', default='0') == '1'
+# заголовок Server-Timing показывает клиенту число запросов и время в
+# базе, поэтому по умолчанию не отдаётся
+SERVER_TIMING = os.getenv('SERVER_TIMING', default='0') == '1'
+
+# Асинхронные вьюхи чтения (web_site.async_views), включаются foodgram.asgi
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', default='0') == '1'
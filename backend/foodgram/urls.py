@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from drf_yasg import openapi
@@ -39,3 +40,7 @@ urlpatterns = [
     path('api/', include("users.urls")),
     path('api/', include("web_site.urls")),
 ]
+
+# асинхронные GET-эндпоинты рецептов, тегов и ингредиентов под ASGI
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns.insert(-2, path('api/', include("web_site.async_urls")))
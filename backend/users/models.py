@@ -31,6 +31,11 @@ class User(AbstractUser):
         max_length=30,
         blank=False
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name="Количество рецептов",
+        default=0,
+        editable=False
+    )
 
 
 class Follow(models.Model):
@@ -50,3 +55,10 @@ class Follow(models.Model):
             "user",
             "following",
         )
+        # подписчики автора: подсчёт и проверка подписки от following
+        indexes = [
+            models.Index(
+                fields=["following", "user"],
+                name="follow_following_user_idx"
+            )
+        ]
@@ -4,7 +4,9 @@ from rest_framework import serializers
 from rest_framework.authtoken.models import Token
 from rest_framework.validators import UniqueTogetherValidator
 
+from web_site import images
 from web_site.models import Recipe
+from web_site.viewer import get_viewer
 from . import models
 
 
@@ -23,13 +25,7 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        if (self.context.get('request')
-                and not self.context['request'].user.is_anonymous):
-            return models.Follow.objects.filter(
-                user=self.context['request'].user,
-                following=obj
-            ).exists()
-        return False
+        return get_viewer(self.context.get('request')).is_subscribed(obj.pk)
 
 
 class PasswordSerializer(serializers.Serializer):
@@ -53,6 +49,7 @@ class PasswordSerializer(serializers.Serializer):
 
 class RecipeWithOutIngredientsSerializer(serializers.ModelSerializer):
     """Рецепт без ингредиентов"""
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -60,9 +57,13 @@ class RecipeWithOutIngredientsSerializer(serializers.ModelSerializer):
             "id",
             "name",
             "image",
+            "image_variants",
             "cooking_time"
         )
 
+    def get_image_variants(self, obj):
+        return images.get_urls(obj, self.context.get("request"))
+
 
 class TokenSerializer(serializers.ModelSerializer):
     # source="key" означает, что в таблице token будет заполнено key
@@ -127,14 +128,7 @@ class ShowFollowerSerializer(serializers.ModelSerializer):
     """obj - подписчик, проверка пользователя на подписку"""
 
     def if_is_subscribed(self, obj):
-        request = self.context.get("request")
-        if request is None or request.user.is_anonymous:
-            return False
-        return models.Follow.objects.filter(
-            user=request.user,
-            following=obj
-        ).exists()
+        return get_viewer(self.context.get("request")).is_subscribed(obj.pk)
 
     def get_recipes_count(self, obj):
-        count = obj.recipes.all().count()
-        return count
+        return obj.recipes_count
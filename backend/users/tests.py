@@ -0,0 +1,73 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from web_site.models import Recipe
+from .models import Follow, User
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class SubscriptionsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="reader",
+            email="reader@example.com",
+            password="password",
+            first_name="Reader",
+            last_name="Reader"
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.author_number = 0
+
+    def follow_authors(self, count, recipes=4):
+        for _ in range(count):
+            self.author_number += 1
+            author = User.objects.create_user(
+                username=f"author{self.author_number}",
+                email=f"author{self.author_number}@example.com",
+                password="password",
+                first_name="Author",
+                last_name="Author"
+            )
+            for index in range(recipes):
+                Recipe.objects.create(
+                    author=author,
+                    name=f"Рецепт {index}",
+                    image="recipe.png",
+                    text="Описание",
+                    cooking_time=10
+                )
+            Follow.objects.create(user=self.user, following=author)
+
+    def get_subscriptions(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/users/subscriptions/", params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_recipes_limit_and_query_count(self):
+        self.follow_authors(1)
+        small_page_queries, data = self.get_subscriptions(recipes_limit=2)
+        self.follow_authors(5)
+        full_page_queries, data = self.get_subscriptions(recipes_limit=2)
+        self.assertEqual(small_page_queries, full_page_queries)
+        self.assertEqual(data["count"], 6)
+        author = data["results"][0]
+        self.assertTrue(author["is_subscribed"])
+        self.assertEqual(author["recipes_count"], 4)
+        self.assertEqual(
+            [recipe["name"] for recipe in author["recipes"]],
+            ["Рецепт 3", "Рецепт 2"]
+        )
+
+    def test_page_limit(self):
+        self.follow_authors(3, recipes=1)
+        _, data = self.get_subscriptions(limit=2, page=2)
+        self.assertEqual(len(data["results"]), 1)
+        self.assertEqual(len(data["results"][0]["recipes"]), 1)
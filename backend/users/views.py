@@ -1,11 +1,12 @@
 from django.contrib.auth.hashers import make_password
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 from rest_framework import (
     status,
     viewsets
 )
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import (
     IsAuthenticated,
     AllowAny
@@ -13,6 +14,9 @@ from rest_framework.permissions import (
 from rest_framework.response import Response
 
 from rest_framework import serializers
+from web_site.metrics import QueryBudgetMixin
+from web_site.models import Recipe
+from web_site.pagination import PageLimitPagination
 from .models import (
     User,
     Follow
@@ -25,7 +29,7 @@ from .serializers import (
 )
 
 
-class UserView(viewsets.ModelViewSet):
+class UserView(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = (AllowAny,)
@@ -115,14 +119,31 @@ class UserView(viewsets.ModelViewSet):
             permission_classes=(IsAuthenticated,)
             )
     def subscriptions(self, request):
-        user = request.user
-        follow = Follow.objects.filter(user=user)
-        user_obj = []
-        for follow_obj in follow:
-            user_obj.append(follow_obj.following)
-        paginator = PageNumberPagination()
+        # авторы берутся одним запросом по Follow с JOIN на пользователя,
+        # страница режется в базе, а последние recipes_limit рецептов всех
+        # авторов страницы догружаются одним запросом с оконной функцией
+        authors = User.objects.filter(
+            following__user=request.user
+        ).order_by("following__id")
+        recipes = Recipe.objects.order_by("-pub_date", "-id")
+        recipes_limit = request.query_params.get("recipes_limit")
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes.annotate(
+                author_position=Window(
+                    RowNumber(),
+                    partition_by=F("author"),
+                    order_by=[F("pub_date").desc(), F("id").desc()]
+                )
+            ).filter(author_position__lte=int(recipes_limit))
+        authors = authors.prefetch_related(
+            Prefetch("recipes", queryset=recipes)
+        )
+        paginator = PageLimitPagination()
         paginator.page_size = 6
-        result_page = paginator.paginate_queryset(user_obj, request)
-        serializer = ShowFollowerSerializer(result_page, many=True,
-                                            context={"current_user": user})
+        result_page = paginator.paginate_queryset(authors, request)
+        serializer = self.time_serializer(ShowFollowerSerializer(
+            result_page,
+            many=True,
+            context={"request": request}
+        ))
         return paginator.get_paginated_response(serializer.data)
@@ -14,6 +14,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'cooking_time',
         'text',
         "in_favorites",
+        'in_carts_count',
         'image',
         'author'
     )
@@ -24,7 +25,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'image',
         'author'
     )
-    readonly_fields = ('in_favorites',)
+    readonly_fields = ('in_favorites', 'in_carts_count')
     list_filter = (
         'name',
         'author'
@@ -33,7 +34,7 @@ class RecipeAdmin(admin.ModelAdmin):
 
     @admin.display(description='В избранном')
     def in_favorites(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
     in_favorites.short_description = "В избранном"
 
@@ -5,3 +5,5 @@ class WebSiteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'web_site'
 
+    def ready(self):
+        from . import signals  # noqa: F401
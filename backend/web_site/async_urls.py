@@ -0,0 +1,22 @@
+"""Маршруты web_site.async_views. Подключаются перед web_site.urls и
+перекрывают маршруты роутера с теми же именами."""
+from django.urls import path
+
+from . import async_views
+
+urlpatterns = [
+    path("tags/", async_views.tags, name="tags-list"),
+    path("tags/<int:pk>/", async_views.tag, name="tags-detail"),
+    path(
+        "ingredients/",
+        async_views.ingredients,
+        name="ingredients-list"
+    ),
+    path(
+        "ingredients/<int:pk>/",
+        async_views.ingredient,
+        name="ingredients-detail"
+    ),
+    path("recipes/", async_views.recipes, name="recipes-list"),
+    path("recipes/<int:pk>/", async_views.recipe, name="recipes-detail"),
+]
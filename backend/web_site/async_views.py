@@ -0,0 +1,219 @@
+"""Асинхронные версии горячих GET-эндпоинтов для работы под ASGI.
+
+Список и детальная страница рецептов, теги и ингредиенты (с подсказками
+по названию) читаются через асинхронный ORM, поэтому пока один запрос
+ждёт базу, процесс обслуживает другие. Запись остаётся за синхронными
+вьюсетами DRF: read_or_write() отдаёт им все методы, кроме GET и HEAD.
+
+Queryset, фильтры, пагинация, права, кэш ответов анонимам и сериализаторы
+берутся у тех же вьюсетов, поэтому ответы совпадают с синхронными. Не
+поддерживаются только условные запросы (ConditionalGetMixin): ETag и 304
+здесь не отдаются, и ответы всегда в JSON, без browsable API.
+
+Маршруты (web_site.async_urls) подключаются в foodgram.urls при
+ASYNC_READ_VIEWS, его включает foodgram.asgi.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    NotAuthenticated,
+    NotFound
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from . import autocomplete, metrics, models, snapshots
+from .cache import response_cache
+from .viewer import get_viewer
+from .views import IngredientsView, RecipeView, TagView
+
+
+def render(data, status=200, headers=None):
+    response = HttpResponse(
+        JSONRenderer().render(data),
+        status=status,
+        content_type="application/json",
+        headers=headers
+    )
+    response["Vary"] = "Accept"
+    return response
+
+
+def handle_exception(view, exc):
+    """Ответ на ошибку, как в APIView.handle_exception()"""
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        auth_header = view.get_authenticate_header(view.request)
+        if auth_header:
+            exc.auth_header = auth_header
+        else:
+            exc.status_code = 403
+    response = exception_handler(exc, view.get_exception_handler_context())
+    if response is None:
+        raise exc
+    # WWW-Authenticate и Retry-After, тип содержимого задаёт render()
+    headers = {
+        name: value
+        for name, value in response.items()
+        if name != "Content-Type"
+    }
+    return render(response.data, response.status_code, headers)
+
+
+async def authenticate(request):
+    # без заголовка Authorization TokenAuthentication не ищет токен,
+    # и пользователь определяется без запросов к базе
+    if "HTTP_AUTHORIZATION" in request.META:
+        return await sync_to_async(lambda: request.user)()
+    return request.user
+
+
+def read_view(view_class, action):
+    """Асинхронная вьюха чтения для действия action вьюсета view_class.
+
+    Обёрнутая функция получает экземпляр вьюсета с DRF Request, как после
+    APIView.initial(), и возвращает данные ответа. Анонимам данные
+    отдаются из кэша ответов с заголовком X-Cache.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            instance = view_class(
+                args=args,
+                kwargs=kwargs,
+                format_kwarg=None,
+                action=action
+            )
+            instance.request = Request(
+                request,
+                authenticators=instance.get_authenticators(),
+                parser_context={"view": instance}
+            )
+            instance.headers = {}
+            try:
+                await authenticate(instance.request)
+                instance.check_permissions(instance.request)
+                if issubclass(view_class, metrics.QueryBudgetMixin):
+                    metrics.enable(request)
+                if not response_cache.is_cacheable(instance.request):
+                    return render(await func(instance, *args, **kwargs))
+                key = response_cache.make_key(instance.request)
+                group = instance.get_cache_group()
+                data = await response_cache.aget(key, group)
+                if data is not None:
+                    return render(data, headers={"X-Cache": "HIT"})
+                data = await func(instance, *args, **kwargs)
+                await response_cache.aset(key, data, group)
+                return render(data, headers={"X-Cache": "MISS"})
+            except (APIException, Http404) as exc:
+                return handle_exception(instance, exc)
+        return view
+    return decorator
+
+
+def read_or_write(read, write):
+    """GET и HEAD - асинхронной вьюхе read, остальные методы -
+    синхронной write в отдельном потоке"""
+    async def view(request, *args, **kwargs):
+        if request.method in ("GET", "HEAD"):
+            return await read(request, *args, **kwargs)
+        return await sync_to_async(write)(request, *args, **kwargs)
+    # csrf_exempt() в Django 4.2 делает из асинхронной вьюхи синхронную
+    view.csrf_exempt = True
+    return view
+
+
+# флаги пользователя и недостающие снимки рецептов загружаются до
+# сериализации: сериализатор выполняется в цикле событий и не может
+# ходить в базу
+async def load_viewer(request):
+    if request.user.is_authenticated:
+        await sync_to_async(get_viewer)(request)
+
+
+@read_view(RecipeView, "list")
+async def recipe_list(view):
+    queryset = view.filter_queryset(view.get_queryset())
+    page = await view.paginator.apaginate_queryset(
+        queryset,
+        view.request,
+        view
+    )
+    await load_viewer(view.request)
+    await sync_to_async(snapshots.ensure)(page)
+    serializer = view.get_serializer(page, many=True)
+    return view.paginator.get_paginated_response(serializer.data).data
+
+
+@read_view(RecipeView, "retrieve")
+async def recipe_detail(view, pk):
+    recipe = await view.filter_queryset(view.get_queryset()).filter(
+        pk=pk
+    ).afirst()
+    if recipe is None:
+        raise NotFound()
+    await load_viewer(view.request)
+    await sync_to_async(snapshots.ensure)([recipe])
+    return view.get_serializer(recipe).data
+
+
+@read_view(TagView, "list")
+async def tag_list(view):
+    tags = [tag async for tag in view.get_queryset()]
+    return view.get_serializer(tags, many=True).data
+
+
+@read_view(TagView, "retrieve")
+async def tag_detail(view, pk):
+    tag = await view.get_queryset().filter(pk=pk).afirst()
+    if tag is None:
+        raise NotFound()
+    return view.get_serializer(tag).data
+
+
+@read_view(IngredientsView, "list")
+async def ingredient_list(view):
+    params = view.request.query_params
+    name = params.get("name", "").strip()
+    if name:
+        ingredients = await autocomplete.asearch(
+            name,
+            autocomplete.get_limit(params.get("limit"))
+        )
+    else:
+        ingredients = [
+            ingredient
+            async for ingredient in view.filter_queryset(view.get_queryset())
+        ]
+    return view.get_serializer(ingredients, many=True).data
+
+
+@read_view(IngredientsView, "retrieve")
+async def ingredient_detail(view, pk):
+    ingredient = await models.Ingredient.objects.filter(pk=pk).afirst()
+    if ingredient is None:
+        raise NotFound()
+    return view.get_serializer(ingredient).data
+
+
+LIST = {"get": "list", "post": "create"}
+DETAIL = {
+    "get": "retrieve",
+    "put": "update",
+    "patch": "partial_update",
+    "delete": "destroy",
+}
+
+recipes = read_or_write(recipe_list, RecipeView.as_view(LIST))
+recipe = read_or_write(recipe_detail, RecipeView.as_view(DETAIL))
+tags = read_or_write(tag_list, TagView.as_view(LIST))
+tag = read_or_write(tag_detail, TagView.as_view(DETAIL))
+ingredients = read_or_write(ingredient_list, IngredientsView.as_view(LIST))
+ingredient = read_or_write(
+    ingredient_detail,
+    IngredientsView.as_view(DETAIL)
+)
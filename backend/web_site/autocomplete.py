@@ -0,0 +1,138 @@
+"""Автодополнение ингредиентов по названию.
+
+Названия всех ингредиентов держатся в памяти процесса отсортированными
+после casefold(), префикс ищется бинарным поиском. Индекс сбрасывается
+сигналами при сохранении и удалении Ingredient, а раз в
+INGREDIENT_INDEX_TTL секунд перестраивается, чтобы подхватывать изменения,
+сделанные другими процессами.
+"""
+import bisect
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from . import models
+
+
+def get_limit(value):
+    """Число подсказок из параметра limit, ограниченное настройками"""
+    default = settings.INGREDIENT_SEARCH_LIMIT
+    try:
+        limit = int(value) if value else default
+    except (TypeError, ValueError):
+        return default
+    return min(max(limit, 1), settings.INGREDIENT_SEARCH_MAX_LIMIT)
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = []
+        self._ids = []
+        self._built_at = None
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def _is_fresh(self):
+        return (self._built_at is not None
+                and time.monotonic() - self._built_at
+                <= settings.INGREDIENT_INDEX_TTL)
+
+    def get_fresh_entries(self):
+        """Названия и id, если индекс не нужно перестраивать, иначе None.
+        Не ждёт блокировку: пока индекс перестраивается, тоже None."""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return (self._names, self._ids) if self._is_fresh() else None
+        finally:
+            self._lock.release()
+
+    def _get_entries(self):
+        with self._lock:
+            if not self._is_fresh():
+                entries = sorted(
+                    (name.casefold(), pk)
+                    for pk, name in models.Ingredient.objects.values_list(
+                        "pk",
+                        "name"
+                    )
+                )
+                self._names = [name for name, _ in entries]
+                self._ids = [pk for _, pk in entries]
+                self._built_at = time.monotonic()
+            return self._names, self._ids
+
+    def search(self, query, limit):
+        return match(*self._get_entries(), query, limit)
+
+
+def match(names, ids, query, limit):
+    """id ингредиентов: сначала совпадения по началу названия,
+    затем по вхождению подстроки, внутри групп по алфавиту"""
+    query = query.strip().casefold()
+    found = []
+    position = bisect.bisect_left(names, query)
+    while (position < len(names) and len(found) < limit
+           and names[position].startswith(query)):
+        found.append(ids[position])
+        position += 1
+    if len(found) < limit:
+        for name, pk in zip(names, ids):
+            if query in name and not name.startswith(query):
+                found.append(pk)
+                if len(found) == limit:
+                    break
+    return found
+
+
+index = IngredientIndex()
+
+
+def get_database_queryset(query):
+    """Тот же поиск средствами базы, если индекс в памяти отключён"""
+    query = query.strip()
+    return models.Ingredient.objects.filter(
+        Q(name__istartswith=query) | Q(name__icontains=query)
+    ).annotate(
+        rank=Case(
+            When(name__istartswith=query, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField()
+        )
+    ).order_by("rank", "name")
+
+
+def search_database(query, limit):
+    return list(get_database_queryset(query)[:limit])
+
+
+def search(query, limit):
+    if not settings.INGREDIENT_INDEX_ENABLED:
+        return search_database(query, limit)
+    ids = index.search(query, limit)
+    ingredients = models.Ingredient.objects.in_bulk(ids)
+    return [ingredients[pk] for pk in ids if pk in ingredients]
+
+
+async def asearch(query, limit):
+    """search() для асинхронных вьюх. Поиск по индексу в памяти не ходит
+    в базу, пока индекс не устарел, поэтому в поток он уходит, только
+    когда индекс нужно перестроить."""
+    if not settings.INGREDIENT_INDEX_ENABLED:
+        return [
+            ingredient
+            async for ingredient in get_database_queryset(query)[:limit]
+        ]
+    entries = index.get_fresh_entries()
+    if entries is None:
+        ids = await sync_to_async(index.search)(query, limit)
+    else:
+        ids = match(*entries, query, limit)
+    ingredients = await models.Ingredient.objects.ain_bulk(ids)
+    return [ingredients[pk] for pk in ids if pk in ingredients]
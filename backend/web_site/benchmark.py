@@ -0,0 +1,414 @@
+"""Сценарии замеров производительности для команды benchmark.
+
+Каждый сценарий создаёт себе данные сам, команда выполняет его внутри
+транзакции и откатывает её, поэтому база после замера не меняется.
+Сценарий возвращает словарь: замеры measure() или текст (план запроса).
+"""
+import base64
+import math
+import shutil
+import statistics
+import tempfile
+import time
+from io import BytesIO
+
+from django.db import connection, connections
+from django.db.utils import load_backend
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import images, models, snapshots, synthetic
+from .pagination import RecipePagination
+from .views import RecipeView
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Регистрирует функцию как сценарий с именем name"""
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def measure(func, repeat):
+    """Вызывает func repeat раз, возвращает задержки в мс и число запросов"""
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = len(captured)
+    return {
+        "repeat": repeat,
+        "mean": round(statistics.mean(timings), 3),
+        "p50": round(percentile(timings, 50), 3),
+        "p95": round(percentile(timings, 95), 3),
+        "p99": round(percentile(timings, 99), 3),
+        "queries": queries,
+    }
+
+
+def get_client(user=None):
+    """Клиент с настоящим заголовком Authorization: запрос токена
+    TokenAuthentication попадает в замеры, как в продакшене"""
+    client = APIClient(SERVER_NAME="localhost")
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return client
+
+
+def create_user(username):
+    return models.User.objects.create_user(
+        username=username,
+        email=f"{username}@benchmark.local",
+        password="benchmark",
+        first_name=username,
+        last_name=username
+    )
+
+
+def create_ingredients(count, prefix="ингредиент"):
+    return models.Ingredient.objects.bulk_create(
+        models.Ingredient(
+            name=f"{prefix} {index}",
+            measurement_unit=("г", "мл", "шт")[index % 3]
+        )
+        for index in range(count)
+    )
+
+
+def create_recipes(author, count, ingredients, per_recipe=10,
+                   with_snapshots=True):
+    recipes = models.Recipe.objects.bulk_create(
+        models.Recipe(
+            author=author,
+            name=f"Рецепт {index}",
+            image="benchmark.png",
+            text="Описание рецепта",
+            cooking_time=10
+        )
+        for index in range(count)
+    )
+    models.IngredientInRecipe.objects.bulk_create(
+        models.IngredientInRecipe(
+            recipe=recipe,
+            ingredient=ingredients[(index + shift) % len(ingredients)],
+            amount=shift + 1
+        )
+        for index, recipe in enumerate(recipes)
+        for shift in range(per_recipe)
+    )
+    if with_snapshots:
+        snapshots.rebuild([recipe.pk for recipe in recipes])
+    return recipes
+
+
+@scenario("shopping_cart")
+def shopping_cart_scenario(repeat):
+    """Скачивание списка покупок в каждом формате для корзин из 10, 100 и
+    250 рецептов, без кэша и из кэша"""
+    ingredients = create_ingredients(300)
+    author = create_user("benchmark_author")
+    recipes = create_recipes(author, 250, ingredients)
+    results = {}
+    for size in (10, 100, 250):
+        user = create_user(f"benchmark_cart_{size}")
+        models.ShoppingCart.objects.bulk_create(
+            models.ShoppingCart(user=user, recipe=recipe)
+            for recipe in recipes[:size]
+        )
+        client = get_client(user)
+        for file_format in ("txt", "csv", "pdf"):
+            def download(file_format=file_format):
+                client.get(
+                    "/api/recipes/download_shopping_cart/",
+                    {"format": file_format}
+                )
+
+            label = f"cart_{size}_recipes_{file_format}"
+            results[label] = measure(download, repeat)
+            # повторные выгрузки из кэша по версии корзины
+            with override_settings(SHOPPING_LIST_CACHE_TIMEOUT=60):
+                results[f"{label}_cached"] = measure(download, repeat)
+    return results
+
+
+@scenario("autocomplete")
+def autocomplete_scenario(repeat):
+    """Подсказки ингредиентов по 1-3 первым буквам на ~2200 названиях"""
+    create_ingredients(2200)
+    client = get_client()
+    queries = ("и", "ин", "ингредиент 1", "ент 9")
+    results = {}
+    for enabled, label in ((True, "index"), (False, "database")):
+        with override_settings(INGREDIENT_INDEX_ENABLED=enabled):
+            def search():
+                for query in queries:
+                    client.get("/api/ingredients/", {"name": query})
+
+            results[label] = measure(search, repeat)
+    return results
+
+
+@scenario("recipe_pages")
+def recipe_pages_scenario(repeat):
+    """Первая и 500-я страница ленты: номер страницы против курсора"""
+    author = create_user("benchmark_feed_author")
+    create_recipes(author, 3000, create_ingredients(50), 3)
+    client = get_client()
+    paginator = RecipePagination()
+    paginator.fields = ["pub_date", "id"]
+    # курсор, указывающий на конец 499-й страницы по 6 рецептов
+    last = models.Recipe.objects.order_by("-pub_date", "-id")[499 * 6 - 1]
+    cursor = paginator.encode(last)
+    requests = {
+        "page_1": {"page": 1},
+        "page_500": {"page": 500},
+        "cursor_page_1": {"cursor": ""},
+        "cursor_page_500": {"cursor": cursor},
+    }
+    return {
+        label: measure(
+            lambda params=params: client.get("/api/recipes/", params),
+            repeat
+        )
+        for label, params in requests.items()
+    }
+
+
+@scenario("recipe_create")
+def recipe_create_scenario(repeat):
+    """Создание рецепта с изображением 2000x1500: копии строятся в запросе
+    (как раньше) или откладываются до коммита (schedule)"""
+    buffer = BytesIO()
+    Image.effect_noise((2000, 1500), 64).convert("RGB").save(
+        buffer,
+        format="JPEG"
+    )
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    user = create_user("benchmark_cook")
+    tag = models.Tag.objects.create(
+        name="benchmark",
+        color=models.Tag.BLUE,
+        slug="benchmark"
+    )
+    ingredients = create_ingredients(10, "benchmark")
+    client = get_client(user)
+    payload = {
+        "tags": [tag.id],
+        "ingredients": [
+            {"id": ingredient.id, "amount": 10} for ingredient in ingredients
+        ],
+        "name": "Рецепт",
+        "image": f"data:image/jpeg;base64,{encoded}",
+        "text": "Описание",
+        "cooking_time": 10,
+    }
+
+    def create():
+        return client.post("/api/recipes/", payload, format="json")
+
+    def create_with_variants():
+        images.build_variants(create().data["id"])
+
+    media_root = tempfile.mkdtemp()
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            return {
+                "inline_variants": measure(create_with_variants, repeat),
+                "deferred_variants": measure(create, repeat),
+            }
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+@scenario("tag_filter")
+def tag_filter_scenario(repeat):
+    """Первая страница рецептов по тегам на 100 000 рецептов: JOIN с
+    DISTINCT (как раньше) против EXISTS, плюс планы обоих запросов"""
+    author = create_user("benchmark_tags_author")
+    recipes = create_recipes(author, 100_000, [], 0, with_snapshots=False)
+    tags = models.Tag.objects.bulk_create(
+        models.Tag(
+            name=f"benchmark {index}",
+            color=f"#00000{index}",
+            slug=f"benchmark-{index}"
+        )
+        for index in range(8)
+    )
+    models.TagsInRecipe.objects.bulk_create(
+        (
+            models.TagsInRecipe(recipe=recipe, tag=tags[(index + shift) % 8])
+            for index, recipe in enumerate(recipes)
+            for shift in (0, 3)
+        ),
+        batch_size=10_000
+    )
+    slugs = [tag.slug for tag in tags[:3]]
+    querysets = {
+        "distinct": models.Recipe.objects.filter(
+            tags__slug__in=slugs
+        ).distinct(),
+        "exists": RecipeView.filter_tags(models.Recipe.objects.all(), slugs),
+        "exists_all": RecipeView.filter_tags(
+            models.Recipe.objects.all(),
+            slugs[:2],
+            match_all=True
+        ),
+    }
+    results = {}
+    for label, queryset in querysets.items():
+        # как PageNumberPagination: COUNT(*) и первая страница
+        def first_page(queryset=queryset):
+            queryset.count()
+            list(queryset[:6])
+
+        results[label] = measure(first_page, repeat)
+        results[f"{label}_plan"] = queryset[:6].explain()
+    return results
+
+
+@scenario("routes")
+def routes_scenario(repeat):
+    """Основные маршруты API на синтетическом наборе: уже созданном
+    командой generate_data или, если его нет, наборе по умолчанию"""
+    if not synthetic.exists():
+        synthetic.generate()
+    users = synthetic.get_users().order_by("id")
+    user = users.first()
+    author = users.order_by("-recipes_count", "id").first()
+    recipe = models.Recipe.objects.filter(author=author).first()
+    tags = list(models.Tag.objects.filter(
+        slug__startswith=synthetic.PREFIX
+    ).values_list("slug", flat=True)[:2])
+    # начало названия ингредиента из набора, чтобы подсказки что-то
+    # находили: загруженные filling_db или созданные generate_data
+    ingredient_prefix = recipe.ingredients.order_by("id").values_list(
+        "name",
+        flat=True
+    ).first()[:3]
+    anonymous = get_client()
+    client = get_client(user)
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64)).save(buffer, format="PNG")
+    payload = {
+        "tags": list(models.Tag.objects.filter(
+            slug__in=tags
+        ).values_list("id", flat=True)),
+        "ingredients": [
+            {"id": ingredient_id, "amount": 10}
+            for ingredient_id in recipe.ingredients.values_list(
+                "id",
+                flat=True
+            )
+        ],
+        "name": "Рецепт",
+        "image": "data:image/png;base64,"
+                 + base64.b64encode(buffer.getvalue()).decode(),
+        "text": "Описание",
+        "cooking_time": 10,
+    }
+    requests = {
+        "recipe_list": lambda: anonymous.get("/api/recipes/"),
+        "recipe_list_filtered": lambda: client.get(
+            "/api/recipes/",
+            {"tags": tags, "author": author.id}
+        ),
+        "recipe_list_favorited": lambda: client.get(
+            "/api/recipes/",
+            {"is_favorited": 1}
+        ),
+        "recipe_list_search": lambda: anonymous.get(
+            "/api/recipes/",
+            {"search": synthetic.WORDS[0]}
+        ),
+        "recipe_detail": lambda: client.get(f"/api/recipes/{recipe.id}/"),
+        "recipe_create": lambda: client.post(
+            "/api/recipes/",
+            payload,
+            format="json"
+        ),
+        "subscriptions": lambda: client.get(
+            "/api/users/subscriptions/",
+            {"recipes_limit": 3}
+        ),
+        "shopping_list": lambda: client.get(
+            "/api/recipes/download_shopping_cart/"
+        ),
+        "ingredient_autocomplete": lambda: anonymous.get(
+            "/api/ingredients/",
+            {"name": ingredient_prefix}
+        ),
+    }
+    media_root = tempfile.mkdtemp()
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            return {
+                label: measure(request, repeat)
+                for label, request in requests.items()
+            }
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+def open_connection(alias, **overrides):
+    """Отдельное от сценария (и его транзакции) соединение с базой
+    default с изменёнными настройками"""
+    settings_dict = {**connections["default"].settings_dict, **overrides}
+    backend = load_backend(settings_dict["ENGINE"])
+    return backend.DatabaseWrapper(settings_dict, alias)
+
+
+def request_cycle(wrapper):
+    """Работа с соединением, как в одном запросе: проверка в начале
+    (сигнал request_started), запрос, проверка в конце (request_finished)"""
+    wrapper.close_if_unusable_or_obsolete()
+    with wrapper.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    wrapper.close_if_unusable_or_obsolete()
+
+
+@scenario("connections")
+def connections_scenario(repeat):
+    """Один запрос SELECT 1 на "запрос" с новым соединением каждый раз
+    (CONN_MAX_AGE=0), с постоянным соединением и проверкой перед
+    запросом (CONN_HEALTH_CHECKS) и с соединением из пула foodgram.db"""
+    modes = {
+        "reconnect": {"CONN_MAX_AGE": 0},
+        "persistent": {"CONN_MAX_AGE": None, "CONN_HEALTH_CHECKS": True},
+    }
+    if connection.vendor == "postgresql":
+        modes["pooled"] = {
+            "ENGINE": "foodgram.db",
+            "CONN_MAX_AGE": 0,
+            "CONN_HEALTH_CHECKS": True,
+            "POOL": {"MAX_SIZE": 4},
+        }
+    results = {}
+    for label, overrides in modes.items():
+        wrapper = open_connection(f"benchmark_{label}", **overrides)
+        try:
+            results[label] = measure(lambda: request_cycle(wrapper), repeat)
+            if label == "pooled":
+                results["pool"] = wrapper.get_pool_stats()
+        finally:
+            wrapper.close()
+            if label == "pooled":
+                wrapper.close_pool()
+    if "pooled" not in results:
+        results["pooled"] = "Пул foodgram.db доступен только для PostgreSQL"
+    return results
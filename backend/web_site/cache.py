@@ -0,0 +1,251 @@
+"""Кэш ответов на анонимные GET-запросы к рецептам, тегам и ингредиентам.
+
+Хранилище задаётся настройкой RESPONSE_CACHE["BACKEND"]: по умолчанию
+LRU-словарь в памяти процесса, DjangoCacheBackend хранит ответы в кэше
+Django (например, Redis), общем для всех процессов. Любое изменение
+рецептов, тегов, ингредиентов и связующих таблиц сбрасывает кэш целиком
+(web_site.signals). Ответы, которые зависят от других данных, вьюха
+относит к группе (get_cache_group), и их можно сбросить отдельно:
+например, пересчёт рейтингов (web_site.scores) сбрасывает только списки
+с ?ordering=popular|trending.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.response import Response
+
+
+class BaseBackend:
+    # get() и set() ходят в сеть или на диск: из асинхронных вьюх они
+    # вызываются через sync_to_async
+    blocking = True
+
+    def get(self, key, group=None):
+        raise NotImplementedError
+
+    def set(self, key, value, group=None):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def clear_group(self, group):
+        raise NotImplementedError
+
+
+class LocMemBackend(BaseBackend):
+    """LRU с ограничением по числу записей и времени жизни"""
+    blocking = False
+
+    def __init__(self, options):
+        self.timeout = options["TIMEOUT"]
+        self.max_entries = options["MAX_ENTRIES"]
+        self._data = OrderedDict()
+        # номера поколений групп: записи прошлых поколений вытесняются
+        # по LRU и времени жизни
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def make_key(self, key, group):
+        if group is None:
+            return key
+        return (group, self._generations.get(group, 0), key)
+
+    def get(self, key, group=None):
+        key = self.make_key(key, group)
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, group=None):
+        key = self.make_key(key, group)
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def clear_group(self, group):
+        with self._lock:
+            self._generations[group] = self._generations.get(group, 0) + 1
+
+
+class DjangoCacheBackend(BaseBackend):
+    """Хранит ответы в кэше Django с алиасом RESPONSE_CACHE["ALIAS"].
+
+    Сброс не удаляет ключи, а увеличивает номер поколения, который входит
+    в каждый ключ: так он виден всем процессам, а старые записи вытесняет
+    сам кэш по TTL. У группы ответов есть ещё и своё поколение.
+    """
+    generation_key = "response_cache:generation"
+
+    def __init__(self, options):
+        self.timeout = options["TIMEOUT"]
+        self.cache = caches[options["ALIAS"]]
+
+    def get_group_generation_key(self, group):
+        return f"{self.generation_key}:{group}"
+
+    def make_key(self, key, group=None):
+        generation = self.cache.get_or_set(self.generation_key, 1, None)
+        if group is None:
+            return f"response_cache:{generation}:{key}"
+        group_generation = self.cache.get_or_set(
+            self.get_group_generation_key(group),
+            1,
+            None
+        )
+        return f"response_cache:{generation}:{group}:{group_generation}:{key}"
+
+    def get(self, key, group=None):
+        return self.cache.get(self.make_key(key, group))
+
+    def set(self, key, value, group=None):
+        self.cache.set(self.make_key(key, group), value, self.timeout)
+
+    def incr(self, generation_key):
+        try:
+            self.cache.incr(generation_key)
+        except ValueError:
+            self.cache.set(generation_key, 1, None)
+
+    def clear(self):
+        self.incr(self.generation_key)
+
+    def clear_group(self, group):
+        self.incr(self.get_group_generation_key(group))
+
+
+class ResponseCache:
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            options = settings.RESPONSE_CACHE
+            self._backend = import_string(options["BACKEND"])(options)
+        return self._backend
+
+    def is_cacheable(self, request):
+        return (settings.RESPONSE_CACHE["ENABLED"]
+                and request.method == "GET"
+                and not request.user.is_authenticated)
+
+    def make_key(self, request):
+        # порядок параметров в строке запроса на ключ не влияет
+        params = urlencode(sorted(
+            (name, value)
+            for name in request.query_params
+            for value in request.query_params.getlist(name)
+        ))
+        return f"{request.get_host()}{request.path}?{params}"
+
+    def get(self, key, group=None):
+        value = self.backend.get(key, group)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, group=None):
+        self.backend.set(key, value, group)
+
+    async def aget(self, key, group=None):
+        if self.backend.blocking:
+            return await sync_to_async(self.get)(key, group)
+        return self.get(key, group)
+
+    async def aset(self, key, value, group=None):
+        if self.backend.blocking:
+            await sync_to_async(self.set)(key, value, group)
+        else:
+            self.set(key, value, group)
+
+    def invalidate(self, group=None):
+        """Сбрасывает кэш (или только ответы группы group) сразу и ещё раз
+        после коммита транзакции, чтобы не остался ответ, закэшированный
+        до коммита по старым данным"""
+        if group is None:
+            clear = self.backend.clear
+        else:
+            clear = partial(self.backend.clear_group, group)
+        clear()
+        transaction.on_commit(clear)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": settings.RESPONSE_CACHE["BACKEND"],
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+response_cache = ResponseCache()
+
+
+class CachedReadMixin:
+    """list и retrieve для анонимных пользователей отдаются из кэша,
+    заголовок X-Cache показывает, был ли ответ найден в кэше"""
+
+    def get_cache_group(self):
+        """Группа ответа для ResponseCache.invalidate(group), None - без
+        группы"""
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list,
+            request,
+            *args,
+            **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve,
+            request,
+            *args,
+            **kwargs
+        )
+
+    def get_cached_response(self, method, request, *args, **kwargs):
+        if not response_cache.is_cacheable(request):
+            return method(request, *args, **kwargs)
+        key = response_cache.make_key(request)
+        group = self.get_cache_group()
+        data = response_cache.get(key, group)
+        if data is not None:
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+        response = method(request, *args, **kwargs)
+        if response.status_code == 200:
+            response_cache.set(key, response.data, group)
+        response["X-Cache"] = "MISS"
+        return response
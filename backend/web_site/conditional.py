@@ -0,0 +1,96 @@
+"""Условные GET-запросы (If-None-Match / If-Modified-Since).
+
+ETag строится не по готовому ответу, а по лёгкому запросу к базе: id и
+время изменения объектов (get_last_modified()) плюс флаги текущего
+пользователя. Поэтому ответ 304 отдаётся до сериализации и без подгрузки
+связанных данных.
+"""
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """Вьюсет должен определить get_validator_queryset() - тот же queryset,
+    что и для ответа, но без prefetch_related, - и get_validator(obj) -
+    значения объекта, от которых зависит его представление."""
+
+    def get_validator_queryset(self):
+        raise NotImplementedError
+
+    def get_validator(self, obj):
+        raise NotImplementedError
+
+    def make_etag(self, data):
+        data = [self.request.accepted_renderer.format, data]
+        digest = hashlib.sha1(
+            json.dumps(data, default=str, sort_keys=True).encode()
+        ).hexdigest()
+        return quote_etag(digest)
+
+    def get_conditional_response(self, etag, last_modified=None):
+        return get_conditional_response(
+            self.request,
+            etag=etag,
+            last_modified=last_modified
+        )
+
+    def set_validators(self, response, etag, last_modified=None):
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        # флаги в ответе зависят от пользователя
+        patch_vary_headers(response, ("Authorization",))
+        return response
+
+    def get_last_modified(self, obj):
+        return obj.updated_at
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = self.get_validator_queryset().filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        ).first()
+        if obj is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = self.make_etag(self.get_validator(obj))
+        last_modified = int(self.get_last_modified(obj).timestamp())
+        response = self.get_conditional_response(etag, last_modified)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    def get_list_etag(self, objects, paginated=True):
+        if not paginated:
+            data = [self.get_validator(obj) for obj in objects]
+        else:
+            # count/next/previous тоже входят в ответ
+            data = [
+                self.get_paginated_response([]).data,
+                [self.get_validator(obj) for obj in objects],
+            ]
+        return self.make_etag(data)
+
+    def list(self, request, *args, **kwargs):
+        # Last-Modified для списка не отдаётся: после удаления рецепта
+        # страница меняется, а максимальный updated_at на ней - нет.
+        # Лёгкий проход по validator queryset нужен, только если клиенту
+        # есть с чем сравнивать, иначе ETag считается по выданной странице.
+        if "HTTP_IF_NONE_MATCH" in request.META:
+            queryset = self.get_validator_queryset()
+            page = self.paginate_queryset(queryset)
+            etag = self.get_list_etag(
+                queryset if page is None else page,
+                page is not None
+            )
+            response = self.get_conditional_response(etag)
+            if response is not None:
+                return self.set_validators(response, etag)
+        response = super().list(request, *args, **kwargs)
+        page = getattr(self.paginator, "page", None)
+        if response.status_code != 200 or page is None:
+            # ответ из кэша ответов: страница не выбиралась
+            return response
+        return self.set_validators(response, self.get_list_etag(page))
@@ -0,0 +1,76 @@
+"""Денормализованные счётчики Recipe.favorites_count, Recipe.in_carts_count
+и User.recipes_count.
+
+Сигналы меняют их атомарно через F() при создании и удалении записей,
+reconcile() пересчитывает их по исходным таблицам.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from . import models
+
+
+def change(model, pk, field, delta):
+    # разошедшийся счётчик может быть уже 0, а поле положительное:
+    # отрицательное значение нарушило бы CHECK, до reconcile() он
+    # остаётся нулём
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")}).order_by().values(
+                field
+            ).annotate(count=Count("pk")).values("count")
+        ),
+        0
+    )
+
+
+# модель -> {счётчик: (модель, по которой он считается, поле связи)}
+COUNTERS = {
+    models.Recipe: {
+        "favorites_count": (models.Favorite, "recipe"),
+        "in_carts_count": (models.ShoppingCart, "recipe"),
+    },
+    models.User: {
+        "recipes_count": (models.Recipe, "author"),
+    },
+}
+
+
+def track(sender, instance, delta):
+    """Меняет счётчики, которые считаются по записям модели sender"""
+    for model, counters in COUNTERS.items():
+        for field, (source, relation) in counters.items():
+            if source is sender:
+                pk = getattr(instance, f"{relation}_id")
+                change(model, pk, field, delta)
+
+
+def reconcile(fix=True, batch_size=1000):
+    """Находит строки с разошедшимися счётчиками и при fix=True
+    исправляет их. Возвращает число таких строк по моделям."""
+    drift = {}
+    for model, counters in COUNTERS.items():
+        queryset = model.objects.annotate(**{
+            f"actual_{field}": count_subquery(source, relation)
+            for field, (source, relation) in counters.items()
+        }).exclude(**{
+            field: F(f"actual_{field}") for field in counters
+        }).order_by("pk")
+        changed = list(queryset)
+        for obj in changed:
+            for field in counters:
+                setattr(obj, field, getattr(obj, f"actual_{field}"))
+        if fix and changed:
+            model.objects.bulk_update(
+                changed,
+                list(counters),
+                batch_size=batch_size
+            )
+        drift[model._meta.label] = len(changed)
+    return drift
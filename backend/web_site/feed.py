@@ -0,0 +1,75 @@
+"""Лента рецептов авторов, на которых подписан пользователь
+(/api/recipes/feed/).
+
+Лента собирается при чтении одним запросом: рецепты авторов из подписок
+пользователя (Follow) сортируются по (pub_date, id), авторы берутся по
+уникальному индексу (user, following), их рецепты - по индексу
+recipe_author_pub_date_id_idx. Страницы выдаются только по курсору
+(FeedPagination), без COUNT(*) по всей ленте.
+
+При FEED_CACHE_TIMEOUT > 0 id первых FEED_HEAD_SIZE + 1 рецептов ленты
+("голова") кэшируются по пользователю, и первая страница без фильтров
+выбирается по первичному ключу, без соединения с подписками. Голова
+сбрасывается, когда автор из подписок публикует или удаляет рецепт и
+когда пользователь подписывается или отписывается (web_site.signals).
+"""
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from users.models import Follow
+from . import models
+
+
+def get_queryset(queryset, user):
+    """Рецепты queryset, авторы которых в подписках user. Подзапрос по
+    Follow, а не author__following__user: так не присоединяется таблица
+    пользователей"""
+    return queryset.filter(
+        author__in=Follow.objects.filter(user=user).values("following")
+    )
+
+
+def get_cache_key(user_id):
+    return f"feed:{user_id}"
+
+
+def get_head(user, queryset, ordering):
+    """id первых рецептов ленты или None, если голова не кэшируется"""
+    timeout = settings.FEED_CACHE_TIMEOUT
+    if not timeout:
+        return None
+    key = get_cache_key(user.pk)
+    head = cache.get(key)
+    if head is None:
+        # на один рецепт больше: по нему видно, есть ли следующая страница
+        head = array("q", queryset.order_by(*ordering).values_list(
+            "pk",
+            flat=True
+        )[:settings.FEED_HEAD_SIZE + 1])
+        cache.set(key, head, timeout)
+    return head
+
+
+def invalidate(user_ids):
+    """Сбрасывает головы лент сразу и после коммита транзакции"""
+    if not settings.FEED_CACHE_TIMEOUT:
+        return
+    keys = [get_cache_key(user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_followers(author_id):
+    if settings.FEED_CACHE_TIMEOUT:
+        invalidate(Follow.objects.filter(
+            following_id=author_id
+        ).values_list("user_id", flat=True))
+
+
+def get_head_queryset(head):
+    return models.Recipe.objects.filter(pk__in=list(head))
@@ -0,0 +1,132 @@
+import binascii
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+# первые байты файла для каждого формата
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+)
+# формат -> (расширение, content type)
+FORMATS = {
+    "PNG": ("png", "image/png"),
+    "JPEG": ("jpg", "image/jpeg"),
+    "GIF": ("gif", "image/gif"),
+    "WEBP": ("webp", "image/webp"),
+}
+
+
+def detect_format(head):
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, image_format in SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """Изображение в base64, декодируемое по частям во временный файл.
+
+    Размер оценивается по длине строки ещё до декодирования, формат
+    проверяется по первым байтам, а число пикселей - по заголовку
+    изображения, без распаковки. В памяти не держится вторая копия
+    изображения: файл до IMAGE_UPLOAD_SPOOL_SIZE байт остаётся в памяти,
+    больший сбрасывается на диск.
+    """
+    # кратно 4, чтобы куски строки декодировались независимо
+    chunk_size = 64 * 1024
+    default_error_messages = {
+        "invalid_base64": "Изображение должно быть строкой base64.",
+        "too_large": "Размер изображения больше {max_bytes} байт.",
+        "too_many_pixels": "В изображении больше {max_pixels} пикселей.",
+        "invalid_format": "Поддерживаются только PNG, JPEG, GIF и WebP.",
+        "invalid_image": "Файл повреждён или не является изображением.",
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data:
+            self.fail("invalid_base64")
+        max_bytes = settings.IMAGE_UPLOAD_MAX_BYTES
+        start = data.find(";base64,")
+        start = 0 if start == -1 else start + len(";base64,")
+        if (len(data) - start) // 4 * 3 > max_bytes:
+            self.fail("too_large", max_bytes=max_bytes)
+        file = SpooledTemporaryFile(
+            max_size=settings.IMAGE_UPLOAD_SPOOL_SIZE
+        )
+        try:
+            size = self.decode(data, start, file)
+            if size > max_bytes:
+                self.fail("too_large", max_bytes=max_bytes)
+            image_format = self.check_image(file)
+        except BaseException:
+            file.close()
+            raise
+        extension, content_type = FORMATS[image_format]
+        file.seek(0)
+        return UploadedFile(
+            file=file,
+            name=f"{uuid.uuid4()}.{extension}",
+            content_type=content_type,
+            size=size
+        )
+
+    def decode(self, data, start, file):
+        """Пишет декодированные байты в file, возвращает их число"""
+        size = 0
+        rest = ""
+        head = b""
+        for offset in range(start, len(data), self.chunk_size):
+            chunk = rest + "".join(
+                data[offset:offset + self.chunk_size].split()
+            )
+            usable = len(chunk) - len(chunk) % 4
+            rest = chunk[usable:]
+            try:
+                decoded = binascii.a2b_base64(chunk[:usable])
+            except binascii.Error:
+                self.fail("invalid_base64")
+            if head is not None:
+                # формат проверяется, как только набралось 12 байт
+                head += decoded[:12]
+                if len(head) >= 12:
+                    self.check_format(head)
+                    head = None
+            size += file.write(decoded)
+        if rest or size == 0:
+            self.fail("invalid_base64")
+        if head is not None:
+            self.check_format(head)
+        return size
+
+    def check_format(self, head):
+        if detect_format(head) is None:
+            self.fail("invalid_format")
+
+    def check_image(self, file):
+        max_pixels = settings.IMAGE_UPLOAD_MAX_PIXELS
+        file.seek(0)
+        expected = detect_format(file.read(12))
+        file.seek(0)
+        try:
+            # Image.open читает только заголовок, пиксели не распаковываются
+            with Image.open(file) as image:
+                width, height = image.size
+                if width * height > max_pixels:
+                    self.fail("too_many_pixels", max_pixels=max_pixels)
+                if image.format != expected:
+                    self.fail("invalid_format")
+                image.verify()
+        except serializers.ValidationError:
+            raise
+        except Exception:
+            self.fail("invalid_image")
+        return expected
@@ -0,0 +1,116 @@
+"""Уменьшенные копии изображений рецептов.
+
+Запрос на создание или изменение рецепта только сохраняет присланный
+файл, а копии размеров из RECIPE_IMAGE_VARIANTS строит пул потоков после
+коммита транзакции. Копии сохраняются в формате RECIPE_IMAGE_FORMAT без
+метаданных (EXIF и пр.), их пути записываются в Recipe.image_variants.
+Пока копии не готовы, image_variants пустой и клиенты используют image.
+"""
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import models, snapshots
+from .cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {
+    "WEBP": "webp",
+    "JPEG": "jpg",
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            thread_name_prefix="recipe-images"
+        )
+    return _executor
+
+
+def schedule(recipe_id):
+    """Построить копии изображения рецепта после коммита транзакции"""
+    transaction.on_commit(lambda: submit(recipe_id))
+
+
+def submit(recipe_id):
+    if settings.RECIPE_IMAGE_ASYNC:
+        get_executor().submit(build_in_thread, recipe_id)
+    else:
+        build_variants(recipe_id)
+
+
+def build_in_thread(recipe_id):
+    try:
+        build_variants(recipe_id)
+    except Exception:
+        logger.exception("Не удалось обработать изображение рецепта %s",
+                         recipe_id)
+    finally:
+        # у каждого потока пула своё соединение с базой
+        connection.close()
+
+
+def render(image, size, image_format):
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    if image_format == "JPEG" and variant.mode != "RGB":
+        variant = variant.convert("RGB")
+    buffer = BytesIO()
+    # info с EXIF и ICC не передаётся в save, метаданные не сохраняются
+    variant.save(buffer, format=image_format, quality=80)
+    return buffer.getvalue()
+
+
+def build_variants(recipe_id):
+    recipe = models.Recipe.objects.filter(pk=recipe_id).only(
+        "image",
+        "image_variants"
+    ).first()
+    if recipe is None or not recipe.image:
+        return
+    image_format = settings.RECIPE_IMAGE_FORMAT
+    with recipe.image.open("rb") as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    prefix = f"recipes/{recipe_id}/{uuid.uuid4().hex}"
+    variants = {}
+    for name, size in settings.RECIPE_IMAGE_VARIANTS.items():
+        variants[name] = default_storage.save(
+            f"{prefix}-{name}.{EXTENSIONS[image_format]}",
+            ContentFile(render(image, size, image_format))
+        )
+    # пока строились копии, изображение могли заменить
+    updated = models.Recipe.objects.filter(
+        pk=recipe_id,
+        image=recipe.image.name
+    ).update(image_variants=variants, updated_at=timezone.now())
+    if updated:
+        snapshots.rebuild([recipe_id])
+        response_cache.invalidate()
+    stale = recipe.image_variants.values() if updated else variants.values()
+    for path in stale:
+        default_storage.delete(path)
+
+
+def get_urls(recipe, request=None):
+    urls = {}
+    for name, path in (recipe.image_variants or {}).items():
+        url = default_storage.url(path)
+        urls[name] = request.build_absolute_uri(url) if request else url
+    return urls
@@ -0,0 +1,97 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from web_site.benchmark import SCENARIOS
+
+# показатели, которые сравниваются с предыдущим запуском (--compare)
+COMPARED = ("p50", "p95", "p99", "queries")
+
+
+class Command(BaseCommand):
+    help = "Замеры задержки и числа запросов для горячих эндпоинтов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios",
+            nargs="*",
+            help=f"Сценарии для запуска: {', '.join(sorted(SCENARIOS))}. "
+                 "По умолчанию запускаются все"
+        )
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument(
+            "--response-cache",
+            action="store_true",
+            help="Не отключать кэш ответов на анонимные запросы"
+        )
+        parser.add_argument(
+            "--json",
+            type=Path,
+            help="Сохранить результаты в JSON-файл"
+        )
+        parser.add_argument(
+            "--compare",
+            type=Path,
+            help="JSON-файл предыдущего запуска для сравнения"
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options["scenarios"]) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(
+                f"Неизвестные сценарии: {', '.join(sorted(unknown))}"
+            )
+        baseline = {}
+        if options["compare"]:
+            try:
+                baseline = json.loads(options["compare"].read_text())
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Не удалось прочитать файл: {error}")
+        response_cache = {
+            **settings.RESPONSE_CACHE,
+            "ENABLED": options["response_cache"],
+        }
+        report = {}
+        for name in options["scenarios"] or sorted(SCENARIOS):
+            # данные сценария не должны оставаться в базе
+            with transaction.atomic(), override_settings(
+                    RESPONSE_CACHE=response_cache):
+                results = SCENARIOS[name](repeat=options["repeat"])
+                transaction.set_rollback(True)
+            report[name] = results
+            for label, result in results.items():
+                if isinstance(result, str):
+                    self.stdout.write(f"{name}.{label}:\n{result}")
+                    continue
+                self.stdout.write(
+                    f"{name}.{label}: "
+                    + ", ".join(
+                        f"{key}={value}" for key, value in result.items()
+                    )
+                )
+                previous = baseline.get(name, {}).get(label)
+                if isinstance(previous, dict):
+                    self.stdout.write(
+                        "    " + self.compare(previous, result)
+                    )
+        if options["json"]:
+            options["json"].write_text(
+                json.dumps(report, ensure_ascii=False, indent=2)
+            )
+
+    def compare(self, previous, result):
+        changes = []
+        for key in COMPARED:
+            if key not in previous or key not in result:
+                continue
+            before, after = previous[key], result[key]
+            change = (
+                f"{(after - before) / before * 100:+.1f}%" if before
+                else f"{after - before:+}"
+            )
+            changes.append(f"{key} {before} -> {after} ({change})")
+        return "; ".join(changes)
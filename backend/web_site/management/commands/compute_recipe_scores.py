@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from web_site import scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчёт рейтингов рецептов для ?ordering=popular|trending, "
+        "с --interval - по расписанию"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Пересчитывать каждые INTERVAL секунд, пока команду не "
+                 "остановят"
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        interval = options["interval"]
+        while True:
+            start = time.monotonic()
+            count = scores.compute(batch_size=options["batch_size"])
+            duration = time.monotonic() - start
+            self.stdout.write(
+                f"Рейтинги {count} рецептов посчитаны за {duration:.2f} с"
+            )
+            if not interval:
+                return
+            # между расчётами соединение с базой не держится
+            close_old_connections()
+            time.sleep(max(interval - duration, 0))
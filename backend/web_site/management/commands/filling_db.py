@@ -1,10 +1,91 @@
-from django.core.management.base import BaseCommand
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
 from web_site import models
 
 
+def normalize(value):
+    # лишние пробелы и перевод строки в конце строки CSV
+    return " ".join(value.split())
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    for item in json.load(file):
+        yield item["name"], item["measurement_unit"]
+
+
+READERS = {
+    ".csv": read_csv,
+    ".json": read_json,
+}
+
+
 class Command(BaseCommand):
+    help = "Загрузка ингредиентов из CSV или JSON файла"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default=settings.BASE_DIR / "ingredients.csv",
+            type=Path
+        )
+        parser.add_argument(
+            "--format",
+            choices=[suffix[1:] for suffix in READERS],
+            help="Формат файла, по умолчанию определяется по расширению"
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def get_ingredients(self, rows):
+        """Нормализованные ингредиенты без повторов внутри файла"""
+        seen = set()
+        for name, measurement_unit in rows:
+            key = (normalize(name), normalize(measurement_unit))
+            if not all(key) or key in seen:
+                continue
+            seen.add(key)
+            yield models.Ingredient(name=key[0], measurement_unit=key[1])
+
     def handle(self, *args, **options):
-        with open("ingredients.csv", 'r', encoding="utf-8") as file:
-            for line in file:
-                element = line.split(",")
-                models.Ingredient.objects.get_or_create(name=element[0], measurement_unit=element[1])
+        path = options["path"]
+        suffix = f".{options['format']}" if options["format"] else path.suffix
+        if suffix not in READERS:
+            raise CommandError(f"Неизвестный формат файла: {path}")
+        start = time.perf_counter()
+        before = models.Ingredient.objects.count()
+        read = 0
+        try:
+            with open(path, encoding="utf-8") as file:
+                ingredients = self.get_ingredients(READERS[suffix](file))
+                while True:
+                    batch = list(islice(ingredients, options["batch_size"]))
+                    if not batch:
+                        break
+                    read += len(batch)
+                    # строки, которые уже есть в базе, пропускает
+                    # ограничение unique_ingredient
+                    models.Ingredient.objects.bulk_create(
+                        batch,
+                        ignore_conflicts=True
+                    )
+        except OSError as error:
+            raise CommandError(error)
+        created = models.Ingredient.objects.count() - before
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Уникальных строк: {read}, добавлено: {created}, "
+            f"за {elapsed:.2f} с ({read / elapsed:.0f} строк/с)"
+        ))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from web_site import synthetic
+
+
+class Command(BaseCommand):
+    help = "Детерминированный синтетический набор данных для замеров"
+
+    def add_arguments(self, parser):
+        for name, default in synthetic.DEFAULTS.items():
+            parser.add_argument(
+                f"--{name.replace('_', '-')}",
+                type=int,
+                default=default
+            )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Удалить ранее сгенерированный набор перед созданием"
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            deleted = synthetic.clear()
+            self.stdout.write(f"Удалено строк: {deleted}")
+        elif synthetic.exists():
+            raise CommandError(
+                "Набор уже сгенерирован, используйте --clear"
+            )
+        start = time.perf_counter()
+        created = synthetic.generate(
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            **{name: options[name] for name in synthetic.DEFAULTS}
+        )
+        elapsed = time.perf_counter() - start
+        for name, count in created.items():
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(f"Готово за {elapsed:.1f} с")
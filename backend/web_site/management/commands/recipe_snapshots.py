@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from web_site import models, snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Сборка недостающих снимков рецептов и проверка, что снимки "
+        "совпадают с данными в базе"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Сравнить все снимки с базой и показать расхождения, "
+                 "ничего не исправляя"
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Сравнить все снимки с базой и исправить расхождения"
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if options["check"] or options["fix"]:
+            with transaction.atomic():
+                result = snapshots.check(
+                    fix=options["fix"],
+                    batch_size=batch_size
+                )
+            self.stdout.write(
+                f"Без снимка: {result['missing']}, "
+                f"устаревших: {result['stale']}"
+            )
+            return
+        missing = models.Recipe.objects.filter(
+            snapshot__isnull=True
+        ).values_list("pk", flat=True)
+        with transaction.atomic():
+            built = snapshots.rebuild(missing, batch_size)
+        self.stdout.write(f"Собрано снимков: {len(built)}")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from web_site import counters
+
+
+class Command(BaseCommand):
+    help = "Пересчёт счётчиков избранного, списков покупок и рецептов автора"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только показать расхождения, ничего не исправляя"
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = counters.reconcile(
+                fix=not options["check"],
+                batch_size=options["batch_size"]
+            )
+        for label, count in drift.items():
+            self.stdout.write(f"{label}: расхождений {count}")
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from web_site import models, throughput
+
+
+class Command(BaseCommand):
+    help = (
+        "Пропускная способность горячих GET-эндпоинтов под WSGI и ASGI "
+        "(нужны данные в базе, например из generate_data)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "servers",
+            nargs="*",
+            help="wsgi и (или) asgi, по умолчанию оба"
+        )
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=10,
+            help="Длительность нагрузки на каждый сервер, с"
+        )
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Запрашиваемые пути, по кругу. По умолчанию список и "
+                 "страница рецепта, подсказки ингредиентов и теги"
+        )
+        parser.add_argument(
+            "--response-cache",
+            action="store_true",
+            help="Не отключать кэш ответов на анонимные запросы"
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options["servers"]) - set(throughput.SERVERS)
+        if unknown:
+            raise CommandError(
+                f"Неизвестные серверы: {', '.join(sorted(unknown))}"
+            )
+        paths = options["paths"] or self.get_default_paths()
+        for name in options["servers"] or ("wsgi", "asgi"):
+            try:
+                result = throughput.run(
+                    name,
+                    paths,
+                    concurrency=options["concurrency"],
+                    duration=options["duration"],
+                    workers=options["workers"],
+                    port=options["port"],
+                    response_cache=options["response_cache"]
+                )
+            except RuntimeError as error:
+                raise CommandError(f"{name}: {error}")
+            self.stdout.write(
+                f"{name}: "
+                + ", ".join(f"{key}={value}" for key, value in result.items())
+            )
+
+    def get_default_paths(self):
+        recipe = models.Recipe.objects.order_by("-pub_date", "-id").first()
+        if recipe is None:
+            raise CommandError(
+                "В базе нет рецептов, сначала выполните generate_data"
+            )
+        return [
+            "/api/recipes/",
+            f"/api/recipes/{recipe.pk}/",
+            "/api/recipes/?limit=20&cursor=",
+            "/api/ingredients/?name=%D1%81%D0%B0",
+            "/api/tags/",
+        ]
@@ -0,0 +1,238 @@
+"""Число SQL-запросов, время в базе и в сериализаторах для каждого запроса.
+
+QueryBudgetMiddleware считает запросы к базе через
+connection.execute_wrapper, а вьюхи с QueryBudgetMixin добавляют к этому
+время сериализации. Для таких вьюх в лог web_site.metrics пишется строка
+JSON с метриками, а при SERVER_TIMING ответ получает заголовок
+Server-Timing. Если маршрут превысил бюджет из QUERY_BUDGETS, это пишется
+в лог как предупреждение, а при QUERY_BUDGET_RAISE (его включают тесты) -
+поднимается QueryBudgetExceeded.
+
+Для потоковых ответов запросы, выполненные при отдаче тела, в заголовок
+уже не попадают, но учитываются в строке лога и в проверке бюджета.
+"""
+import json
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async
+)
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# метрики текущего запроса для кода, у которого нет доступа к request
+current = ContextVar("request_metrics", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.enabled = False
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.connects = 0
+        self.connect_time = 0.0
+        self.started = time.perf_counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # обёртка для connection.execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    def get_server_timing(self):
+        total = time.perf_counter() - self.started
+        timings = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f"serializer;dur={self.serializer_time * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ]
+        if self.connects:
+            timings.insert(0, f"conn;dur={self.connect_time * 1000:.1f}")
+        return ", ".join(timings)
+
+
+def record_connect(duration):
+    """Учитывает получение соединения с базой (foodgram.db)"""
+    metrics = current.get()
+    if metrics is not None:
+        metrics.connects += 1
+        metrics.connect_time += duration
+
+
+def get_route(request):
+    match = request.resolver_match
+    return match.view_name if match else None
+
+
+def get_budget(request):
+    """Бюджет "МЕТОД маршрут" или, если его нет, маршрута целиком"""
+    route = get_route(request)
+    budgets = settings.QUERY_BUDGETS
+    return budgets.get(f"{request.method} {route}", budgets.get(route))
+
+
+def enable(request):
+    """Включает Server-Timing, лог и бюджет для запроса"""
+    metrics = getattr(request, "metrics", None)
+    if metrics is not None:
+        metrics.enabled = True
+
+
+def time_serializer(request, serializer):
+    """Учитывает время to_representation() сериализатора в метриках"""
+    metrics = getattr(request, "metrics", None)
+    if metrics is None:
+        return serializer
+    to_representation = serializer.to_representation
+
+    def timed(instance):
+        start = time.perf_counter()
+        try:
+            return to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+
+    serializer.to_representation = timed
+    return serializer
+
+
+# connection - соединение потока, в котором вызвана функция, поэтому
+# обёртку нужно ставить и снимать в том же потоке, что и запросы
+def add_wrapper(wrapper):
+    connection.execute_wrappers.append(wrapper)
+
+
+def remove_wrapper(wrapper):
+    connection.execute_wrappers.remove(wrapper)
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = request.metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            with connection.execute_wrapper(metrics):
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.process_response(request, response, metrics)
+
+    async def __acall__(self, request):
+        # под ASGI синхронный код запроса, в том числе запросы к базе
+        # асинхронного ORM, выполняется в одном отдельном потоке со своим
+        # соединением
+        metrics = request.metrics = RequestMetrics()
+        token = current.set(metrics)
+        await sync_to_async(add_wrapper)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(remove_wrapper)(metrics)
+            current.reset(token)
+        if response.streaming and response.is_async:
+            # асинхронное тело здесь не обернуть, размер неизвестен
+            return self.process_response(request, response, metrics, None)
+        return self.process_response(request, response, metrics)
+
+    def process_response(self, request, response, metrics, size=0):
+        if not metrics.enabled:
+            return response
+        if settings.SERVER_TIMING:
+            response["Server-Timing"] = metrics.get_server_timing()
+        if size is None:
+            self.finish(request, response, metrics, size)
+            return response
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request,
+                response,
+                metrics,
+                response.streaming_content
+            )
+            return response
+        self.finish(request, response, metrics, len(response.content))
+        return response
+
+    def stream(self, request, response, metrics, content):
+        size = 0
+        with connection.execute_wrapper(metrics):
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        self.finish(request, response, metrics, size)
+
+    def finish(self, request, response, metrics, size):
+        data = {
+            "method": request.method,
+            "route": get_route(request),
+            "status": response.status_code,
+            "queries": metrics.queries,
+            "db_ms": round(metrics.db_time * 1000, 1),
+            "serializer_ms": round(metrics.serializer_time * 1000, 1),
+            "connects": metrics.connects,
+            "connect_ms": round(metrics.connect_time * 1000, 1),
+            "total_ms": round(
+                (time.perf_counter() - metrics.started) * 1000,
+                1
+            ),
+            "size": size,
+        }
+        logger.info(json.dumps(data), extra={"metrics": data})
+        budget = get_budget(request)
+        if budget is None:
+            return
+        exceeded = [
+            f"{key}={data[key]} > {limit}"
+            for key, limit in budget.items()
+            if data[key] is not None and data[key] > limit
+        ]
+        if not exceeded:
+            return
+        message = (
+            f"{request.method} {data['route']}: бюджет превышен, "
+            + ", ".join(exceeded)
+        )
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message, extra={"metrics": data})
+
+
+class QueryBudgetMixin:
+    """Включает Server-Timing, лог и бюджет для вьюхи и учитывает время
+    сериализаторов, полученных через get_serializer() или
+    time_serializer(). В это время входят и запросы к базе, сделанные
+    сериализатором."""
+
+    def initial(self, request, *args, **kwargs):
+        enable(request)
+        super().initial(request, *args, **kwargs)
+
+    def get_serializer(self, *args, **kwargs):
+        return self.time_serializer(super().get_serializer(*args, **kwargs))
+
+    def time_serializer(self, serializer):
+        return time_serializer(self.request, serializer)
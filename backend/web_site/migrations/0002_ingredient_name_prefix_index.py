@@ -0,0 +1,32 @@
+from django.db import migrations
+
+# istartswith в PostgreSQL превращается в UPPER("name"::text) LIKE UPPER(...),
+# при локали, отличной от C, такой LIKE использует только индекс
+# с text_pattern_ops. В SQLite индекс не нужен.
+INDEX_NAME = 'ingredient_name_prefix_idx'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+        'ON web_site_ingredient (UPPER("name") text_pattern_ops)'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_site', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize(value):
+    # как в filling_db: лишние пробелы и перевод строки в конце
+    return " ".join(value.split())
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Приводит названия и единицы измерения к виду, в котором их
+    записывает filling_db, и сливает совпавшие после этого ингредиенты.
+    Иначе повторный импорт добавил бы нормализованную копию рядом со
+    старой строкой, а unique_ingredient не создался бы на дублях."""
+    Ingredient = apps.get_model('web_site', 'Ingredient')
+    IngredientInRecipe = apps.get_model('web_site', 'IngredientInRecipe')
+    kept = {}
+    for ingredient in Ingredient.objects.order_by('pk'):
+        key = (
+            normalize(ingredient.name),
+            normalize(ingredient.measurement_unit)
+        )
+        original = kept.get(key)
+        if original is None:
+            kept[key] = ingredient
+            if (ingredient.name, ingredient.measurement_unit) != key:
+                ingredient.name, ingredient.measurement_unit = key
+                ingredient.save(update_fields=['name', 'measurement_unit'])
+            continue
+        # рецепты дубля переходят к первому ингредиенту, а если в рецепте
+        # были оба, количества складываются (unique_combination)
+        for item in IngredientInRecipe.objects.filter(ingredient=ingredient):
+            existing = IngredientInRecipe.objects.filter(
+                recipe_id=item.recipe_id,
+                ingredient=original
+            ).first()
+            if existing is None:
+                item.ingredient = original
+                item.save(update_fields=['ingredient'])
+                continue
+            if item.amount is not None:
+                existing.amount = (existing.amount or 0) + item.amount
+                existing.save(update_fields=['amount'])
+            item.delete()
+        ingredient.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('web_site', '0002_ingredient_name_prefix_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientinrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_combination'),
+        ),
+    ]
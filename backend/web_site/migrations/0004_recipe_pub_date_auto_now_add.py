@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_site', '0003_ingredient_unique_name_unit'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='pub_date',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Время публикации'),
+        ),
+    ]
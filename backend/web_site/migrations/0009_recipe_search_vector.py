@@ -0,0 +1,50 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:15
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# GIN-индекс и заполнение вектора нужны только в PostgreSQL, в SQLite
+# поиск идёт через icontains (web_site.search)
+INDEX_NAME = 'recipe_search_vector_idx'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+        'ON web_site_recipe USING GIN (search_vector)'
+    )
+    schema_editor.execute(
+        "UPDATE web_site_recipe AS recipe SET search_vector = "
+        "setweight(to_tsvector('russian', recipe.name), 'A') || "
+        "setweight(to_tsvector('russian', recipe.text), 'B') || "
+        "setweight(to_tsvector('russian', COALESCE(("
+        "SELECT string_agg(ingredient.name, ' ') "
+        "FROM web_site_ingredientinrecipe AS item "
+        "JOIN web_site_ingredient AS ingredient "
+        "ON ingredient.id = item.ingredient_id "
+        "WHERE item.recipe_id = recipe.id), '')), 'C')"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_site', '0008_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_site', '0009_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tagsinrecipe',
+            index=models.Index(fields=['tag', 'recipe'], name='tagsinrecipe_tag_recipe_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:18
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_tags(apps, schema_editor):
+    """Повторные теги рецепта мешают создать unique_recipe_tag"""
+    TagsInRecipe = apps.get_model('web_site', 'TagsInRecipe')
+    kept = TagsInRecipe.objects.values('recipe', 'tag').annotate(
+        first_id=Min('id')
+    ).values('first_id')
+    TagsInRecipe.objects.exclude(id__in=kept).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_site', '0010_tagsinrecipe_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['recipe', 'user'], name='favorite_recipe_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['recipe', 'user'], name='shoppingcart_recipe_user_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_tags, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tagsinrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'tag'), name='unique_recipe_tag'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+# icontains в подсказках ингредиентов (web_site.autocomplete) превращается
+# в UPPER("name"::text) LIKE UPPER('%...%'), такой LIKE использует только
+# триграммный индекс по тому же выражению. Префиксный поиск (istartswith)
+# покрывает индекс из 0002. В SQLite индекс не нужен.
+INDEX_NAME = 'ingredient_name_trgm_idx'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+        'ON web_site_ingredient USING GIN (UPPER("name") gin_trgm_ops)'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_site', '0011_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
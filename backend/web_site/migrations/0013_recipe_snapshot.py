@@ -0,0 +1,26 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_site', '0012_ingredient_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSnapshot',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='web_site.recipe', verbose_name='Рецепт')),
+                ('data', models.JSONField(verbose_name='Данные')),
+                ('built_at', models.DateTimeField(auto_now=True, verbose_name='Время сборки')),
+            ],
+            options={
+                'verbose_name': 'Снимок рецепта',
+                'verbose_name_plural': 'Снимки рецептов',
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
@@ -56,6 +57,15 @@ class Ingredient(models.Model):
         ordering = ['name']
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'name',
+                    'measurement_unit'
+                ],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f"{self.name}, {self.measurement_unit}"
@@ -73,6 +83,12 @@ class Recipe(models.Model):
         max_length=250
     )
     image = models.ImageField()
+    # пути уменьшенных копий image, их заполняет web_site.images
+    image_variants = models.JSONField(
+        verbose_name="Копии изображения",
+        default=dict,
+        editable=False
+    )
     text = models.TextField(verbose_name="Текстовое описание")
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -92,15 +108,49 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1)]
     )
     pub_date = models.DateTimeField(
-        auto_now=True,
+        auto_now_add=True,
         verbose_name="Время публикации",
         editable=False
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Время изменения"
+    )
+    # счётчики поддерживаются сигналами (web_site.signals),
+    # расхождения исправляет команда reconcile_counters
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном",
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name="В списках покупок",
+        default=0,
+        editable=False
+    )
+    # заполняется только в PostgreSQL, см. web_site.search
+    search_vector = SearchVectorField(
+        verbose_name="Поисковый вектор",
+        null=True,
+        editable=False
+    )
 
     class Meta:
-        ordering = ["-pub_date"]
+        ordering = ["-pub_date", "-id"]
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"],
+                name="recipe_pub_date_id_idx"
+            ),
+            # лента подписок (web_site.feed): рецепты каждого автора
+            # уже упорядочены по времени публикации
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="recipe_author_pub_date_id_idx"
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -158,6 +208,85 @@ class TagsInRecipe(models.Model):
 
     class Meta:
         verbose_name_plural = verbose_name = "Тэги в рецепте"
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'recipe',
+                    'tag'
+                ],
+                name='unique_recipe_tag'
+            )
+        ]
+        # фильтр по тегам ищет рецепты по tag_id (EXISTS в RecipeView)
+        indexes = [
+            models.Index(
+                fields=["tag", "recipe"],
+                name="tagsinrecipe_tag_recipe_idx"
+            )
+        ]
+
+
+class RecipeSnapshot(models.Model):
+    """Готовое представление рецепта без флагов пользователя,
+    собирается web_site.snapshots"""
+    recipe = models.OneToOneField(
+        Recipe,
+        verbose_name="Рецепт",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="snapshot"
+    )
+    data = models.JSONField(verbose_name="Данные")
+    built_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Время сборки"
+    )
+
+    class Meta:
+        verbose_name = "Снимок рецепта"
+        verbose_name_plural = "Снимки рецептов"
+
+    def __str__(self):
+        return f"Снимок рецепта {self.recipe_id}"
+
+
+class RecipeScore(models.Model):
+    """Рейтинги рецепта для ?ordering=popular|trending, пересчитываются
+    командой compute_recipe_scores (web_site.scores)"""
+    recipe = models.OneToOneField(
+        Recipe,
+        verbose_name="Рецепт",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="score"
+    )
+    popular = models.FloatField(verbose_name="Популярность", default=0)
+    trending = models.FloatField(
+        verbose_name="Набирает популярность",
+        default=0
+    )
+    computed_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Время расчёта"
+    )
+
+    class Meta:
+        verbose_name = "Рейтинг рецепта"
+        verbose_name_plural = "Рейтинги рецептов"
+        # страницы выбираются по индексу в порядке ключа курсора
+        indexes = [
+            models.Index(
+                fields=["-popular", "-recipe"],
+                name="recipescore_popular_idx"
+            ),
+            models.Index(
+                fields=["-trending", "-recipe"],
+                name="recipescore_trending_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Рейтинг рецепта {self.recipe_id}"
 
 
 class Favorite(models.Model):
@@ -184,6 +313,19 @@ class Favorite(models.Model):
             "user",
             "recipe"
         )
+        # индекс unique_together начинается с user, а счётчики и
+        # проверки "в избранном ли рецепт" идут от recipe
+        indexes = [
+            models.Index(
+                fields=["recipe", "user"],
+                name="favorite_recipe_user_idx"
+            ),
+            # окно недавних добавлений для web_site.scores
+            models.Index(
+                fields=["when_added"],
+                name="favorite_when_added_idx"
+            )
+        ]
 
     def __str__(self):
         return f"{self.user} added {self.recipe}"
@@ -214,6 +356,16 @@ class ShoppingCart(models.Model):
             "user",
             "recipe"
         )
+        indexes = [
+            models.Index(
+                fields=["recipe", "user"],
+                name="shoppingcart_recipe_user_idx"
+            ),
+            models.Index(
+                fields=["when_added"],
+                name="shoppingcart_when_added_idx"
+            )
+        ]
 
     def __str__(self):
         return f"{self.user} added {self.recipe}"
@@ -0,0 +1,184 @@
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def resolve_field(model, path):
+    """Поле модели по пути вида "score__trending" (рейтинги
+    web_site.scores) или None для аннотаций"""
+    field = None
+    for name in path.split("__"):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        model = field.related_model
+    return field
+
+
+def get_value(obj, path):
+    for name in path.split("__"):
+        obj = getattr(obj, name)
+    return obj
+
+
+class PageLimitPagination(PageNumberPagination):
+    """Номер страницы page и её размер limit, как их передаёт фронтенд"""
+    page_size_query_param = "limit"
+    max_page_size = 100
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset для асинхронных вьюх: COUNT(*) и страница
+        запрашиваются через асинхронный ORM"""
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        # Paginator проверяет номер страницы по числу объектов, сами
+        # объекты страницы выбираются отдельным запросом
+        paginator = self.django_paginator_class(
+            range(await queryset.acount()),
+            page_size
+        )
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number,
+                message=str(exc)
+            ))
+        start = self.page.start_index() - 1
+        return [
+            obj async for obj in queryset[start:start + len(self.page)]
+        ]
+
+
+class RecipePagination(PageLimitPagination):
+    """Номера страниц (page/limit) по умолчанию и выдача по курсору,
+    если в запросе есть параметр cursor (для первой страницы пустой).
+
+    Курсор хранит значения ключа сортировки последнего рецепта, следующая
+    страница выбирается условием (pub_date, id) < (значения курсора) по
+    индексу recipe_pub_date_id_idx: без COUNT(*) и OFFSET, и новые рецепты
+    не сдвигают уже выданные страницы.
+    """
+    cursor_query_param = "cursor"
+    # только поля, отсортированные по убыванию; последнее поле уникально
+    ordering = ("-pub_date", "-id")
+
+    def get_ordering(self, view):
+        if hasattr(view, "get_keyset_ordering"):
+            return view.get_keyset_ordering()
+        return self.ordering
+
+    def is_cursor_mode(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.is_cursor_mode(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        queryset, page_size = self.get_keyset_page(queryset, request, view)
+        return self.set_keyset_page(list(queryset), page_size)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.is_cursor_mode(request)
+        if not self.cursor_mode:
+            return await super().apaginate_queryset(queryset, request, view)
+        queryset, page_size = self.get_keyset_page(queryset, request, view)
+        return self.set_keyset_page(
+            [obj async for obj in queryset],
+            page_size
+        )
+
+    def get_keyset_page(self, queryset, request, view):
+        """Запрос страницы с одним лишним рецептом: по нему видно, есть ли
+        следующая страница"""
+        self.request = request
+        self.fields = [field.lstrip("-") for field in self.get_ordering(view)]
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(
+                self.get_keyset_filter(self.decode(cursor, queryset.model))
+            )
+        queryset = queryset.order_by(
+            *(f"-{field}" for field in self.fields)
+        )
+        return queryset[:page_size + 1], page_size
+
+    def set_keyset_page(self, page, page_size):
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_keyset_filter(self, values):
+        """(f1, f2, ...) < (v1, v2, ...) в виде, понятном ORM"""
+        condition = Q()
+        for position, field in enumerate(self.fields):
+            equal = {
+                name: value
+                for name, value in zip(self.fields[:position], values)
+            }
+            condition |= Q(**equal, **{f"{field}__lt": values[position]})
+        return condition
+
+    def encode(self, obj):
+        values = [get_value(obj, field) for field in self.fields]
+        # isoformat() без округления микросекунд, в отличие от
+        # DjangoJSONEncoder, иначе рецепты на границе страницы теряются
+        data = json.dumps(values, default=lambda value: value.isoformat())
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode(self, cursor, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if (not isinstance(values, list)
+                    or len(values) != len(self.fields)):
+                raise ValueError
+            return [
+                self.to_python(model, field, value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound("Неверный курсор")
+
+    def to_python(self, model, path, value):
+        # аннотации, например rank поиска, остаются как есть
+        field = resolve_field(model, path)
+        return value if field is None else field.to_python(value)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            "next": self.get_next_link(),
+            "results": data,
+        })
+
+
+class FeedPagination(RecipePagination):
+    """Только выдача по курсору: номера страниц потребовали бы COUNT(*)
+    по всей ленте"""
+
+    def is_cursor_mode(self, request):
+        return True
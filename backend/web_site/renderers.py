@@ -0,0 +1,57 @@
+from rest_framework import renderers, status
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.response import Response
+
+
+class FileRenderer(renderers.BaseRenderer):
+    """Отдаёт готовый файл (bytes) как есть. Формат выбирается параметром
+    format или заголовком Accept, ошибки отдаются в JSON
+    (FileDownloadMixin)."""
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class TxtRenderer(FileRenderer):
+    media_type = "text/plain"
+    format = "txt"
+
+
+class CsvRenderer(FileRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class PdfRenderer(FileRenderer):
+    media_type = "application/pdf"
+    format = "pdf"
+    charset = None
+
+
+class FileContentNegotiation(DefaultContentNegotiation):
+    """Если Accept не подходит ни одному формату (фронтенд присылает
+    application/json), отдаётся формат по умолчанию, а не 406"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+class FileDownloadMixin:
+    """Ответы, кроме самого файла (ошибки авторизации, валидации и т.п.),
+    рендерятся JSONRenderer, как в остальном API"""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (
+            isinstance(response, Response)
+            and response.status_code != status.HTTP_200_OK
+        ):
+            request.accepted_renderer = renderers.JSONRenderer()
+            request.accepted_media_type = (
+                request.accepted_renderer.media_type
+            )
+        return super().finalize_response(request, response, *args, **kwargs)
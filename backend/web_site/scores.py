@@ -0,0 +1,89 @@
+"""Рейтинги рецептов для /api/recipes/?ordering=popular и
+?ordering=trending.
+
+popular - число добавлений рецепта в избранное и в списки покупок
+(счётчики Recipe.favorites_count и in_carts_count) с весами из
+RECIPE_SCORES. trending - те же добавления с затуханием по времени:
+добавление when_added, сделанное age часов назад, даёт
+weight * 0.5 ** (age / HALF_LIFE_HOURS), учитываются добавления за
+последние WINDOW_HOURS.
+
+Считать это в каждом запросе по всей таблице Favorite слишком дорого,
+поэтому compute() по расписанию (команда compute_recipe_scores
+--interval) записывает рейтинги всех рецептов в RecipeScore, а список
+рецептов читает их по индексам этой таблицы. Рецепты, опубликованные
+после последнего расчёта, в рейтингах появятся после следующего.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import models
+from .cache import response_cache
+
+RANKINGS = ("popular", "trending")
+# группа кэша ответов со списками по рейтингам (RecipeView)
+CACHE_GROUP = "rankings"
+
+
+def get_weights():
+    options = settings.RECIPE_SCORES
+    return (
+        (models.Favorite, options["FAVORITE_WEIGHT"]),
+        (models.ShoppingCart, options["CART_WEIGHT"]),
+    )
+
+
+def get_trending(now):
+    """Сумма затухающих вкладов недавних добавлений по id рецепта"""
+    options = settings.RECIPE_SCORES
+    half_life = options["HALF_LIFE_HOURS"] * 3600
+    since = now - timedelta(hours=options["WINDOW_HOURS"])
+    scores = defaultdict(float)
+    for model, weight in get_weights():
+        added = model.objects.filter(when_added__gte=since).order_by(
+        ).values_list("recipe_id", "when_added")
+        for recipe_id, when_added in added.iterator():
+            age = max((now - when_added).total_seconds(), 0)
+            scores[recipe_id] += weight * 0.5 ** (age / half_life)
+    return scores
+
+
+def save(scores):
+    models.RecipeScore.objects.bulk_create(
+        scores,
+        update_conflicts=True,
+        unique_fields=["recipe"],
+        update_fields=["popular", "trending", "computed_at"]
+    )
+
+
+def compute(batch_size=1000, now=None):
+    """Пересчитывает рейтинги всех рецептов, возвращает их число"""
+    options = settings.RECIPE_SCORES
+    trending = get_trending(now or timezone.now())
+    # список целиком: SQLite не даёт писать, пока читается курсор
+    recipes = list(models.Recipe.objects.order_by("pk").values_list(
+        "pk",
+        "favorites_count",
+        "in_carts_count"
+    ))
+    with transaction.atomic():
+        for start in range(0, len(recipes), batch_size):
+            save([
+                models.RecipeScore(
+                    recipe_id=pk,
+                    popular=(
+                        favorites * options["FAVORITE_WEIGHT"]
+                        + carts * options["CART_WEIGHT"]
+                    ),
+                    trending=trending.get(pk, 0.0)
+                )
+                for pk, favorites, carts in recipes[start:start + batch_size]
+            ])
+    # порядок изменился только в списках по рейтингам
+    response_cache.invalidate(CACHE_GROUP)
+    return len(recipes)
@@ -0,0 +1,95 @@
+"""Полнотекстовый поиск рецептов (параметр search в /api/recipes/).
+
+В PostgreSQL поиск идёт по столбцу Recipe.search_vector (tsvector с
+конфигурацией russian и GIN-индексом): название с весом A, описание - B,
+названия ингредиентов - C. Столбец пересчитывается после коммита
+транзакции, в которой рецепт сохранён (web_site.signals), так что
+ингредиенты, добавленные после save(), в него тоже попадают. В других
+базах (SQLite в тестах) поиск сводится к icontains с тем же порядком
+весов.
+"""
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector
+)
+from django.db import connection, transaction
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    TextField,
+    Value,
+    When
+)
+from django.db.models.functions import Cast, Coalesce
+
+from . import models
+
+CONFIG = "russian"
+
+
+def is_supported():
+    return connection.vendor == "postgresql"
+
+
+def get_vector():
+    ingredient_names = models.IngredientInRecipe.objects.filter(
+        recipe=OuterRef("pk")
+    ).values("recipe").annotate(
+        names=StringAgg("ingredient__name", delimiter=" ")
+    ).values("names")
+    return (
+        SearchVector("name", weight="A", config=CONFIG)
+        + SearchVector("text", weight="B", config=CONFIG)
+        + SearchVector(
+            Coalesce(
+                Subquery(ingredient_names),
+                Value(""),
+                output_field=TextField()
+            ),
+            weight="C",
+            config=CONFIG
+        )
+    )
+
+
+def update_vectors(queryset):
+    """Пересчитывает search_vector одним UPDATE"""
+    if is_supported():
+        queryset.update(search_vector=get_vector())
+
+
+def schedule_update(queryset):
+    transaction.on_commit(lambda: update_vectors(queryset))
+
+
+def search(queryset, value):
+    """Рецепты, подходящие под запрос value, с релевантностью rank"""
+    if is_supported():
+        query = SearchQuery(value, config=CONFIG, search_type="websearch")
+        # ts_rank возвращает real: в курсоре значение хранится как
+        # double, и без приведения сравнение rank с ним на равных
+        # рангах теряет или повторяет рецепты
+        return queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+    has_ingredient = Exists(models.IngredientInRecipe.objects.filter(
+        recipe=OuterRef("pk"),
+        ingredient__name__icontains=value
+    ))
+    return queryset.filter(
+        Q(name__icontains=value) | Q(text__icontains=value) | has_ingredient
+    ).annotate(
+        rank=Case(
+            When(name__icontains=value, then=Value(1.0)),
+            When(text__icontains=value, then=Value(0.4)),
+            default=Value(0.2),
+            output_field=FloatField()
+        )
+    )
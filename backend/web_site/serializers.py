@@ -3,7 +3,9 @@ from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
 from users.serializers import UserSerializer
-from . import models
+from . import images, models, snapshots
+from .fields import StreamingBase64ImageField
+from .viewer import get_viewer
 
 
 class TagSerializers(serializers.ModelSerializer):
@@ -54,6 +56,7 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
         many=True
     )
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
     author = UserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField("get_ingredients")
     is_favorited = serializers.SerializerMethodField("get_is_favorite")
@@ -70,30 +73,31 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time"
         )
 
+    def get_image_variants(self, obj):
+        return images.get_urls(obj, self.context.get("request"))
+
+    # obj.recipes - строки IngredientInRecipe, RecipeView догружает их
+    # вместе с ингредиентами через prefetch_related
     def get_ingredients(self, obj):
-        ingredients = models.IngredientInRecipe.objects.filter(recipe=obj)
+        ingredients = obj.recipes.select_related("ingredient")
+        if "recipes" in getattr(obj, "_prefetched_objects_cache", {}):
+            ingredients = obj.recipes.all()
         return IngredientInRecipeSerializers(ingredients, many=True).data
 
+    # флаги берутся из наборов id пользователя, загруженных один раз
+    # на весь запрос (web_site.viewer)
     def get_is_favorite(self, obj):
-        request = self.context.get("request")
-        if request is None or request.user.is_anonymous:
-            return False
-        user = request.user
-        return models.Favorite.objects.filter(recipe=obj, user=user).exists()
+        return get_viewer(self.context.get("request")).is_favorited(obj.pk)
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get("request")
-        if request is None or request.user.is_anonymous:
-            return False
-        user = request.user
-        return models.ShoppingCart.objects.filter(
-            recipe=obj,
-            user=user
-        ).exists()
+        return get_viewer(
+            self.context.get("request")
+        ).is_in_shopping_cart(obj.pk)
 
 
 class AddIngredientToRecipeSerializers(serializers.ModelSerializer):
@@ -110,19 +114,14 @@ class AddIngredientToRecipeSerializers(serializers.ModelSerializer):
 
 
 class CreateRecipeSerializers(serializers.ModelSerializer):
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = StreamingBase64ImageField(max_length=None, use_url=True)
     # сохранение изображения в видде строки - ссылки
     author = UserSerializer(read_only=True)
     ingredients = AddIngredientToRecipeSerializers(many=True)
     # many указывает на то, что будет много данных(список или множество)
     id = serializers.ReadOnlyField()
-    tags = serializers.SlugRelatedField(
-        many=True,
-        queryset=models.Tag.objects.all(),
-        slug_field="id"
-    )
-
-    # queryset - это запрос к бд, который определяет откуда брать данные.
+    # id тегов проверяются в validate() одним запросом, как и ингредиенты
+    tags = serializers.ListField(child=serializers.IntegerField())
 
     class Meta:
         model = models.Recipe
@@ -137,65 +136,167 @@ class CreateRecipeSerializers(serializers.ModelSerializer):
             "cooking_time"
         )
 
+    # при PATCH проверяются только переданные поля
+    def is_passed(self, obj, field):
+        return not self.partial or field in obj
+
     def validate(self, obj):
         for field in ['name', 'text', 'cooking_time']:
-            if not obj.get(field):
-                raise serializers.ValidationError(f'{field} - Обязательное поле.')
-        if not obj.get('tags'):
-            raise serializers.ValidationError('Нужно указать минимум 1 тег.')
+            if self.is_passed(obj, field) and not obj.get(field):
+                raise serializers.ValidationError(
+                    f'{field} - Обязательное поле.'
+                )
+        if self.is_passed(obj, 'tags'):
+            if not obj.get('tags'):
+                raise serializers.ValidationError(
+                    'Нужно указать минимум 1 тег.'
+                )
+            obj['tags'] = list(dict.fromkeys(obj['tags']))
+            missing_tag_id_list = set(obj['tags']) - set(
+                models.Tag.objects.filter(
+                    pk__in=obj['tags']
+                ).order_by().values_list('pk', flat=True)
+            )
+            if missing_tag_id_list:
+                raise serializers.ValidationError(
+                    'Теги не найдены: '
+                    + ', '.join(map(str, sorted(missing_tag_id_list)))
+                )
+        if not self.is_passed(obj, 'ingredients'):
+            return obj
         if not obj.get('ingredients'):
             raise serializers.ValidationError('Нужно указать минимум 1 ингредиент.')
         inrgedient_id_list = [item['id'] for item in obj.get('ingredients')]
         unique_ingredient_id_list = set(inrgedient_id_list)
         if len(inrgedient_id_list) != len(unique_ingredient_id_list):
             raise serializers.ValidationError('Ингредиенты должны быть уникальны.')
+        # все id проверяются одним запросом
+        missing_id_list = unique_ingredient_id_list - set(
+            models.Ingredient.objects.filter(
+                pk__in=unique_ingredient_id_list
+            ).order_by().values_list('pk', flat=True)
+        )
+        if missing_id_list:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: '
+                + ', '.join(map(str, sorted(missing_id_list)))
+            )
         return obj
 
     @transaction.atomic
     def tags_and_ingredients_set(self, recipe, tags, ingredients):
-        recipe.tags.set(tags)
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            amount = ingredient['amount']
-            # Создаем запись в модели IngredientInRecipe
-            models.IngredientInRecipe.objects.create(
+        # по одному INSERT на теги и на ингредиенты рецепта
+        models.TagsInRecipe.objects.bulk_create(
+            models.TagsInRecipe(recipe=recipe, tag_id=tag_id)
+            for tag_id in tags
+        )
+        models.IngredientInRecipe.objects.bulk_create(
+            models.IngredientInRecipe(
                 recipe=recipe,
-                ingredient=models.Ingredient.objects.get(pk=ingredient_id),
-                amount=amount
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount']
             )
+            for ingredient in ingredients
+        )
 
     @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = models.Recipe.objects.create(
+        recipe = models.Recipe(
             author=self.context['request'].user,
             **validated_data
         )
+        # bulk_create тегов и ингредиентов сигналов не шлёт, поэтому
+        # снимок собирается один раз после них, а не в post_save
+        snapshots.defer(recipe)
+        recipe.save()
         self.tags_and_ingredients_set(recipe, tags, ingredients)
+        snapshots.refresh(recipe)
         return recipe
 
+    def update_tags(self, recipe, tags):
+        current = set(
+            models.TagsInRecipe.objects.filter(
+                recipe=recipe
+            ).values_list('tag_id', flat=True)
+        )
+        new = set(tags)
+        if current - new:
+            models.TagsInRecipe.objects.filter(
+                recipe=recipe,
+                tag_id__in=current - new
+            ).delete()
+        if new - current:
+            models.TagsInRecipe.objects.bulk_create(
+                models.TagsInRecipe(recipe=recipe, tag_id=tag_id)
+                for tag_id in new - current
+            )
+        return current != new
+
+    def update_ingredients(self, recipe, ingredients):
+        current = {
+            item.ingredient_id: item
+            for item in models.IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        new = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = current.keys() - new.keys()
+        if removed:
+            models.IngredientInRecipe.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id in current.keys() & new.keys():
+            item = current[ingredient_id]
+            if item.amount != new[ingredient_id]:
+                item.amount = new[ingredient_id]
+                changed.append(item)
+        if changed:
+            models.IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        added = new.keys() - current.keys()
+        if added:
+            models.IngredientInRecipe.objects.bulk_create(
+                models.IngredientInRecipe(
+                    recipe=recipe,
+                    ingredient_id=ingredient_id,
+                    amount=new[ingredient_id]
+                )
+                for ingredient_id in added
+            )
+        return bool(removed or changed or added)
+
     # экземпляр модели
+    # записываются только изменившиеся поля, теги и ингредиенты;
+    # не переданные при PATCH связи остаются как есть
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time',
-            instance.cooking_time
-        )
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        models.IngredientInRecipe.objects.filter(
-            recipe=instance,
-            ingredient__in=instance.ingredients.all()
-        ).delete()
-        self.tags_and_ingredients_set(instance, tags, ingredients)
-        instance.save()
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        for field in changed_fields:
+            setattr(instance, field, validated_data[field])
+        relations_changed = False
+        if tags is not None:
+            relations_changed |= self.update_tags(instance, tags)
+        if ingredients is not None:
+            relations_changed |= self.update_ingredients(instance, ingredients)
+        # updated_at меняется при любом изменении рецепта, в том числе
+        # только тегов или ингредиентов: по нему строятся ETag, а сигнал
+        # post_save сбрасывает кэш ответов и пересобирает снимок рецепта
+        # (bulk-операции сигналов не шлют)
+        if changed_fields or relations_changed:
+            instance.save(update_fields=changed_fields + ['updated_at'])
         return instance
 
     def to_representation(self, instance):
-        return ShowRecipeSerializer(
+        return snapshots.SnapshotSerializer(
             instance,
             context=self.context
         ).data
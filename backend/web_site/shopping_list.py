@@ -0,0 +1,157 @@
+"""Список покупок в форматах txt, csv и pdf.
+
+Строки списка считаются одним агрегирующим запросом, готовый файл
+кэшируется по пользователю и версии его корзины. Версия меняется при
+добавлении и удалении рецептов корзины и при изменении состава рецептов,
+которые в ней лежат (web_site.signals), поэтому повторная выгрузка без
+изменений берётся из кэша без запросов к базе. Как и наборы
+web_site.viewer, файлы кэшируются только при
+SHOPPING_LIST_CACHE_TIMEOUT > 0: по умолчанию это включено с общим для
+процессов кэшем (REDIS_URL), а с одним процессом - явной настройкой.
+"""
+import csv
+import io
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+from reportlab.pdfgen import canvas
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+TITLE = "Список покупок"
+
+
+def get_items(user):
+    """(название, количество, единица) по всем рецептам корзины"""
+    return list(models.IngredientInRecipe.objects.filter(
+        recipe__shopping_cart__user=user
+    ).values(
+        "ingredient__name",
+        "ingredient__measurement_unit"
+    ).annotate(
+        total=Sum("amount")
+    ).order_by(
+        "ingredient__name",
+        "ingredient__measurement_unit"
+    ).values_list(
+        "ingredient__name",
+        "total",
+        "ingredient__measurement_unit"
+    ))
+
+
+def render_txt(items):
+    return "".join(
+        f"{name} - {total} {unit}\n" for name, total, unit in items
+    ).encode()
+
+
+def render_csv(items):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(("Ингредиент", "Количество", "Единица измерения"))
+    writer.writerows(items)
+    return buffer.getvalue().encode()
+
+
+FONT_NAME = "ShoppingList"
+
+
+def get_font():
+    """Имя шрифта reportlab: TrueType с кириллицей из SHOPPING_LIST_FONT,
+    без него - встроенная Helvetica"""
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return FONT_NAME
+    try:
+        pdfmetrics.registerFont(
+            TTFont(FONT_NAME, settings.SHOPPING_LIST_FONT)
+        )
+    except TTFError:
+        # Helvetica без кириллицы, но PDF всё же соберётся
+        logger.warning("Шрифт %s не найден", settings.SHOPPING_LIST_FONT)
+        return "Helvetica"
+    return FONT_NAME
+
+
+def render_pdf(items):
+    """Текстовый PDF формата A4: строки можно выделить и найти поиском,
+    шрифт встраивается в файл только нужными символами"""
+    width, height = A4
+    margin, line_height = 50, 20
+    font = get_font()
+    lines = [
+        f"{name} - {total} {unit}" for name, total, unit in items
+    ] or ["Список пуст"]
+    per_page = int((height - 2 * margin) // line_height) - 2
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle(TITLE)
+    for start in range(0, len(lines), per_page):
+        pdf.setFont(font, 18)
+        pdf.drawString(margin, height - margin, TITLE)
+        text = pdf.beginText(margin, height - margin - 2 * line_height)
+        text.setFont(font, 13)
+        text.setLeading(line_height)
+        text.textLines(lines[start:start + per_page])
+        pdf.drawText(text)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+RENDERERS = {
+    "txt": render_txt,
+    "csv": render_csv,
+    "pdf": render_pdf,
+}
+
+
+def get_version_key(user_id):
+    return f"shopping_list_version:{user_id}"
+
+
+def get_file(user, file_format):
+    timeout = settings.SHOPPING_LIST_CACHE_TIMEOUT
+    if not timeout:
+        return RENDERERS[file_format](get_items(user))
+    # случайная версия, а не счётчик: после вытеснения ключа версии из
+    # кэша старый файл не совпадёт с новой версией
+    version = cache.get_or_set(
+        get_version_key(user.pk),
+        lambda: uuid.uuid4().hex,
+        None
+    )
+    key = f"shopping_list:{user.pk}:{version}:{file_format}"
+    content = cache.get(key)
+    if content is None:
+        content = RENDERERS[file_format](get_items(user))
+        cache.set(key, content, timeout)
+    return content
+
+
+def invalidate(user_ids):
+    """Сбрасывает файлы пользователей сразу и после коммита транзакции"""
+    if not settings.SHOPPING_LIST_CACHE_TIMEOUT:
+        return
+    keys = [get_version_key(user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_recipes(recipes):
+    """Сбрасывает файлы всех, у кого эти рецепты в корзине"""
+    if settings.SHOPPING_LIST_CACHE_TIMEOUT:
+        invalidate(models.ShoppingCart.objects.filter(
+            recipe__in=recipes
+        ).values_list("user_id", flat=True))
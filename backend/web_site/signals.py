@@ -0,0 +1,180 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import Follow
+from . import (
+    autocomplete,
+    counters,
+    feed,
+    images,
+    models,
+    search,
+    shopping_list,
+    snapshots,
+    viewer
+)
+from .cache import response_cache
+
+
+@receiver(post_save, sender=models.Ingredient)
+@receiver(post_delete, sender=models.Ingredient)
+def reset_ingredient_index(sender, **kwargs):
+    autocomplete.index.invalidate()
+
+
+@receiver(post_save, sender=models.Favorite)
+@receiver(post_save, sender=models.ShoppingCart)
+@receiver(post_save, sender=models.Recipe)
+def increase_counters(sender, instance, created, **kwargs):
+    if created:
+        counters.track(sender, instance, 1)
+
+
+@receiver(post_delete, sender=models.Favorite)
+@receiver(post_delete, sender=models.ShoppingCart)
+@receiver(post_delete, sender=models.Recipe)
+def decrease_counters(sender, instance, **kwargs):
+    counters.track(sender, instance, -1)
+
+
+@receiver(post_save, sender=models.Recipe)
+@receiver(post_delete, sender=models.Recipe)
+@receiver(post_save, sender=models.Tag)
+@receiver(post_delete, sender=models.Tag)
+@receiver(post_save, sender=models.Ingredient)
+@receiver(post_delete, sender=models.Ingredient)
+@receiver(post_save, sender=models.IngredientInRecipe)
+@receiver(post_delete, sender=models.IngredientInRecipe)
+@receiver(post_save, sender=models.TagsInRecipe)
+@receiver(post_delete, sender=models.TagsInRecipe)
+def reset_response_cache(sender, **kwargs):
+    response_cache.invalidate()
+
+
+# поля автора, которые есть в ответах с рецептами
+AUTHOR_FIELDS = {"username", "email", "first_name", "last_name"}
+
+
+def changes_author_fields(update_fields):
+    return update_fields is None or bool(AUTHOR_FIELDS & set(update_fields))
+
+
+@receiver(post_save, sender=models.User)
+def reset_author_response_cache(sender, instance, created, update_fields,
+                                **kwargs):
+    if not created and changes_author_fields(update_fields):
+        response_cache.invalidate()
+
+
+@receiver(post_save, sender=models.Favorite)
+@receiver(post_delete, sender=models.Favorite)
+@receiver(post_save, sender=models.ShoppingCart)
+@receiver(post_delete, sender=models.ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_viewer(sender, instance, **kwargs):
+    viewer.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=models.Recipe)
+def build_image_variants(sender, instance, update_fields, **kwargs):
+    if instance.image and (update_fields is None or "image" in update_fields):
+        images.schedule(instance.pk)
+
+
+@receiver(post_save, sender=models.Recipe)
+def update_search_vector(sender, instance, **kwargs):
+    if search.is_supported():
+        search.schedule_update(models.Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=models.Ingredient)
+def update_ingredient_search_vectors(sender, instance, created, **kwargs):
+    if search.is_supported() and not created:
+        search.schedule_update(
+            models.Recipe.objects.filter(ingredients=instance)
+        )
+
+
+@receiver(post_save, sender=models.ShoppingCart)
+@receiver(post_delete, sender=models.ShoppingCart)
+def reset_shopping_list(sender, instance, **kwargs):
+    shopping_list.invalidate([instance.user_id])
+
+
+# состав рецепта меняется bulk-операциями без сигналов, но
+# CreateRecipeSerializers.update после них сохраняет сам рецепт
+@receiver(post_save, sender=models.Recipe)
+@receiver(post_save, sender=models.IngredientInRecipe)
+@receiver(post_delete, sender=models.IngredientInRecipe)
+def reset_recipe_shopping_lists(sender, instance, **kwargs):
+    recipe_id = instance.pk if sender is models.Recipe else instance.recipe_id
+    shopping_list.invalidate_recipes([recipe_id])
+
+
+@receiver(post_save, sender=models.Ingredient)
+def reset_ingredient_shopping_lists(sender, instance, created, **kwargs):
+    if not created:
+        shopping_list.invalidate_recipes(
+            models.Recipe.objects.filter(ingredients=instance)
+        )
+
+
+# снимки пересобираются в транзакции изменения (web_site.snapshots)
+@receiver(post_save, sender=models.Recipe)
+def update_recipe_snapshot(sender, instance, created, **kwargs):
+    if getattr(instance, "_snapshot_deferred", False):
+        return
+    if created:
+        snapshots.create(instance)
+    else:
+        snapshots.refresh(instance)
+
+
+@receiver(post_save, sender=models.IngredientInRecipe)
+@receiver(post_delete, sender=models.IngredientInRecipe)
+@receiver(post_save, sender=models.TagsInRecipe)
+@receiver(post_delete, sender=models.TagsInRecipe)
+def update_relation_snapshot(sender, instance, origin=None, **kwargs):
+    # при удалении рецепта или автора каскадом снимок удаляется сам, а
+    # после удаления связей через queryset (CreateRecipeSerializers)
+    # снимок пересобирается при сохранении рецепта
+    if isinstance(origin, (QuerySet, models.Recipe, models.User)):
+        return
+    # инлайны админки сохраняют связи по строке, снимок собирается один
+    # раз после коммита
+    snapshots.schedule([instance.recipe_id])
+
+
+@receiver(post_save, sender=models.Tag)
+@receiver(post_save, sender=models.Ingredient)
+def update_related_snapshots(sender, instance, created, **kwargs):
+    if not created:
+        snapshots.rebuild(instance.recipes.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=models.User)
+def update_author_snapshots(sender, instance, created, update_fields,
+                            **kwargs):
+    if not created and changes_author_fields(update_fields):
+        snapshots.rebuild(instance.recipes.values_list("pk", flat=True))
+
+
+# голова ленты подписчиков меняется только при публикации и удалении
+# рецепта: время публикации не меняется, а сами рецепты берутся из базы
+@receiver(post_save, sender=models.Recipe)
+def reset_follower_feeds(sender, instance, created, **kwargs):
+    if created:
+        feed.invalidate_followers(instance.author_id)
+
+
+@receiver(post_delete, sender=models.Recipe)
+def reset_follower_feeds_on_delete(sender, instance, **kwargs):
+    feed.invalidate_followers(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_feed(sender, instance, **kwargs):
+    feed.invalidate([instance.user_id])
@@ -0,0 +1,235 @@
+"""Снимки рецептов для чтения (RecipeSnapshot).
+
+Список и страница рецепта отдают готовый JSON из RecipeSnapshot, к
+которому добавляются только флаги текущего пользователя (web_site.viewer)
+и абсолютные ссылки на изображения. Поэтому на чтение нужен один JOIN
+вместо выборок автора, тегов и ингредиентов.
+
+Снимок - это ответ ShowRecipeSerializer без флагов. Он пересобирается в
+той же транзакции, что и изменение рецепта, его тегов и ингредиентов,
+самих тегов и ингредиентов и автора (web_site.signals). Изменения через
+bulk-операции сигналов не шлют, поэтому код, который их делает
+(CreateRecipeSerializers, web_site.synthetic, web_site.images), вызывает
+rebuild() сам. Построчные изменения тегов и ингредиентов рецепта
+(инлайны админки) откладывают пересборку до коммита транзакции
+(schedule()), чтобы снимок рецепта собирался один раз. Рецепты без
+снимка получают его при первом чтении, команда recipe_snapshots собирает
+недостающие снимки и проверяет, что сохранённые совпадают с данными в
+базе.
+"""
+import copy
+import logging
+import threading
+
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework import serializers as drf_serializers
+
+from . import models, serializers
+from .viewer import get_viewer
+
+logger = logging.getLogger(__name__)
+
+# флаги пользователя, которых нет в снимке
+FLAGS = ("is_favorited", "is_in_shopping_cart")
+AUTHOR_FLAGS = ("is_subscribed",)
+
+# id рецептов, снимки которых пересоберутся после коммита, у каждого
+# потока (и его соединения с базой) свои
+_pending = threading.local()
+
+
+def get_queryset():
+    """Рецепты со всем, что нужно ShowRecipeSerializer"""
+    return models.Recipe.objects.select_related("author").prefetch_related(
+        "tags",
+        Prefetch(
+            "recipes",
+            queryset=models.IngredientInRecipe.objects.select_related(
+                "ingredient"
+            )
+        )
+    )
+
+
+def build(recipe):
+    """Данные снимка: ответ ShowRecipeSerializer без флагов и без
+    request, то есть с относительными ссылками на изображения"""
+    data = dict(serializers.ShowRecipeSerializer(recipe).data)
+    for field in FLAGS:
+        del data[field]
+    data["author"] = dict(data["author"])
+    for field in AUTHOR_FLAGS:
+        del data["author"][field]
+    return data
+
+
+def save(snapshots):
+    models.RecipeSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=["recipe"],
+        update_fields=["data", "built_at"]
+    )
+
+
+def batched(values, batch_size):
+    values = list(values)
+    for start in range(0, len(values), batch_size):
+        yield values[start:start + batch_size]
+
+
+def rebuild(recipe_ids, batch_size=500):
+    """Пересобирает снимки рецептов, возвращает их по id рецепта"""
+    snapshots = {}
+    for batch in batched(recipe_ids, batch_size):
+        built = [
+            models.RecipeSnapshot(recipe=recipe, data=build(recipe))
+            for recipe in get_queryset().filter(pk__in=batch)
+        ]
+        save(built)
+        snapshots.update((snapshot.recipe_id, snapshot) for snapshot in built)
+    return snapshots
+
+
+def create(recipe):
+    """Снимок только что созданного рецепта: тегов и ингредиентов у него
+    ещё нет, поэтому он собирается без запросов к базе"""
+    empty = copy.copy(recipe)
+    empty._prefetched_objects_cache = {
+        "tags": models.Tag.objects.none(),
+        "recipes": models.IngredientInRecipe.objects.none(),
+    }
+    snapshot = models.RecipeSnapshot(recipe=recipe, data=build(empty))
+    save([snapshot])
+    recipe.snapshot = snapshot
+
+
+def defer(recipe):
+    """Сигнал post_save не собирает снимок recipe: вызывающий код
+    соберёт его сам через refresh(), когда допишет теги и ингредиенты"""
+    recipe._snapshot_deferred = True
+
+
+def get_pending():
+    if not hasattr(_pending, "ids"):
+        _pending.ids = set()
+    return _pending.ids
+
+
+def schedule(recipe_ids):
+    """Пересобрать снимки после коммита транзакции, по разу на рецепт.
+    Функция регистрируется на каждый вызов: при откате транзакции её
+    колбэки отбрасываются, а id останутся до следующего коммита."""
+    get_pending().update(recipe_ids)
+    transaction.on_commit(flush)
+
+
+def flush():
+    pending = get_pending()
+    recipe_ids = sorted(pending)
+    pending.clear()
+    if recipe_ids:
+        rebuild(recipe_ids)
+
+
+def refresh(recipe):
+    """Пересобирает снимок и подставляет его в recipe.snapshot"""
+    recipe.__dict__.pop("_snapshot_deferred", None)
+    # отложенная пересборка этого рецепта больше не нужна
+    get_pending().discard(recipe.pk)
+    snapshot = rebuild([recipe.pk]).get(recipe.pk)
+    if snapshot is not None:
+        recipe.snapshot = snapshot
+
+
+def has_snapshot(recipe):
+    try:
+        recipe.snapshot
+    except models.RecipeSnapshot.DoesNotExist:
+        return False
+    return True
+
+
+def ensure(recipes):
+    """Собирает снимки рецептов, у которых их нет, одним пакетом"""
+    missing = [recipe for recipe in recipes if not has_snapshot(recipe)]
+    if not missing:
+        return
+    logger.warning(
+        "Нет снимков рецептов %s, выполните recipe_snapshots",
+        ", ".join(str(recipe.pk) for recipe in missing)
+    )
+    snapshots = rebuild([recipe.pk for recipe in missing])
+    for recipe in missing:
+        recipe.snapshot = snapshots[recipe.pk]
+
+
+def present(recipe, request=None):
+    """Снимок рецепта с флагами пользователя запроса"""
+    data = dict(recipe.snapshot.data)
+    viewer = get_viewer(request)
+    data["is_favorited"] = viewer.is_favorited(recipe.pk)
+    data["is_in_shopping_cart"] = viewer.is_in_shopping_cart(recipe.pk)
+    data["author"] = {
+        **data["author"],
+        "is_subscribed": viewer.is_subscribed(data["author"]["id"]),
+    }
+    if request is not None:
+        if data["image"]:
+            data["image"] = request.build_absolute_uri(data["image"])
+        data["image_variants"] = {
+            name: request.build_absolute_uri(url)
+            for name, url in data["image_variants"].items()
+        }
+    # порядок полей как у ShowRecipeSerializer
+    return {
+        field: data[field]
+        for field in serializers.ShowRecipeSerializer.Meta.fields
+    }
+
+
+class SnapshotListSerializer(drf_serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, "all") else data)
+        ensure(recipes)
+        return super().to_representation(recipes)
+
+
+class SnapshotSerializer(drf_serializers.BaseSerializer):
+    """Рецепт для чтения из снимка, поля как у ShowRecipeSerializer"""
+
+    class Meta:
+        list_serializer_class = SnapshotListSerializer
+
+    def to_representation(self, instance):
+        ensure([instance])
+        return present(instance, self.context.get("request"))
+
+
+def check(fix=False, batch_size=500):
+    """Сравнивает снимки с данными в базе. Возвращает число рецептов без
+    снимка и с устаревшим снимком, при fix=True исправляет их."""
+    result = {"missing": 0, "stale": 0}
+    recipe_ids = models.Recipe.objects.order_by("pk").values_list(
+        "pk",
+        flat=True
+    )
+    for batch in batched(recipe_ids, batch_size):
+        stored = dict(models.RecipeSnapshot.objects.filter(
+            recipe__in=batch
+        ).values_list("recipe", "data"))
+        changed = []
+        for recipe in get_queryset().filter(pk__in=batch):
+            data = build(recipe)
+            if recipe.pk not in stored:
+                result["missing"] += 1
+            elif stored[recipe.pk] != data:
+                result["stale"] += 1
+            else:
+                continue
+            changed.append(models.RecipeSnapshot(recipe=recipe, data=data))
+        if fix and changed:
+            save(changed)
+    return result
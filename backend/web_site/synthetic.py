@@ -0,0 +1,224 @@
+"""Детерминированный синтетический набор данных для замеров.
+
+Пользователи, подписки, рецепты с ингредиентами и тегами, избранное и
+списки покупок создаются через bulk_create, все случайные решения берутся
+из random.Random(seed): при том же seed и тех же ингредиентах в базе
+получается тот же набор. bulk_create не отправляет сигналов, поэтому после
+генерации счётчики пересчитываются reconcile(), а поисковые векторы,
+снимки рецептов и кэши обновляются явно.
+
+Все пользователи набора имеют имена с префиксом PREFIX, по нему
+clear() удаляет набор вместе с рецептами и связями.
+"""
+import random
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from users.models import Follow
+from . import autocomplete, counters, models, search, snapshots
+from .cache import response_cache
+
+PREFIX = "synthetic"
+
+WORDS = (
+    "суп", "салат", "пирог", "омлет", "каша", "рагу", "запеканка",
+    "курица", "говядина", "рыба", "грибы", "овощи", "сыр", "картофель",
+    "томаты", "рис", "гречка", "тыква", "яблоки", "ягоды",
+)
+
+DEFAULTS = {
+    "users": 100,
+    "follows": 10,
+    "recipes": 1000,
+    "ingredients": 500,
+    "ingredients_per_recipe": 8,
+    "tags": 8,
+    "favorites": 20,
+    "carts": 5,
+}
+
+
+def batched(objs, batch_size):
+    objs = iter(objs)
+    while True:
+        batch = list(islice(objs, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_create(model, objs, batch_size):
+    """Создаёт объекты порциями, не собирая их все в памяти"""
+    created = 0
+    for batch in batched(objs, batch_size):
+        model.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def get_users():
+    return models.User.objects.filter(username__startswith=PREFIX)
+
+
+def exists():
+    return get_users().exists()
+
+
+def clear():
+    # рецепты, подписки, избранное и списки покупок удаляются каскадом
+    deleted, _ = get_users().delete()
+    return deleted
+
+
+def get_ingredient_ids(count, batch_size):
+    """id первых count ингредиентов: сначала уже загруженные
+    (filling_db), недостающие создаются"""
+    ids = list(models.Ingredient.objects.order_by("id").values_list(
+        "id",
+        flat=True
+    )[:count])
+    if len(ids) < count:
+        models.Ingredient.objects.bulk_create(
+            (
+                models.Ingredient(
+                    name=f"{PREFIX} ингредиент {index}",
+                    measurement_unit=("г", "мл", "шт")[index % 3]
+                )
+                for index in range(count)
+            ),
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+        ids = list(models.Ingredient.objects.order_by("id").values_list(
+            "id",
+            flat=True
+        )[:count])
+    return ids
+
+
+def get_tag_ids(count):
+    slugs = [f"{PREFIX}-{index}" for index in range(count)]
+    models.Tag.objects.bulk_create(
+        (
+            models.Tag(
+                name=f"{PREFIX} {index}",
+                color=f"#5E{index:04X}",
+                slug=slug
+            )
+            for index, slug in enumerate(slugs)
+        ),
+        ignore_conflicts=True
+    )
+    return list(models.Tag.objects.filter(slug__in=slugs).order_by(
+        "id"
+    ).values_list("id", flat=True))
+
+
+def sample(rng, population, count):
+    return rng.sample(population, min(count, len(population)))
+
+
+def sample_others(rng, population, excluded, count):
+    """count элементов population, кроме excluded"""
+    chosen = sample(rng, population, count + 1)
+    return [item for item in chosen if item != excluded][:count]
+
+
+def make_recipes(rng, count, author_ids):
+    for index in range(count):
+        words = rng.sample(WORDS, 6)
+        yield models.Recipe(
+            author_id=rng.choice(author_ids),
+            name=f"{words[0].capitalize()} {index}",
+            image=f"{PREFIX}.png",
+            text=" ".join(words),
+            cooking_time=rng.randint(5, 180)
+        )
+
+
+@transaction.atomic
+def generate(seed=1, batch_size=1000, **options):
+    """Создаёт набор размеров DEFAULTS (с поправками из options),
+    возвращает число созданных строк по моделям"""
+    sizes = {**DEFAULTS, **options}
+    rng = random.Random(seed)
+    ingredient_ids = get_ingredient_ids(sizes["ingredients"], batch_size)
+    tag_ids = get_tag_ids(sizes["tags"])
+    # хэш пароля один на всех: make_password на каждого занял бы минуты
+    password = make_password(PREFIX)
+    created = {}
+    created["users"] = bulk_create(models.User, (
+        models.User(
+            username=f"{PREFIX}{index}",
+            email=f"{PREFIX}{index}@example.com",
+            password=password,
+            first_name=f"Имя{index}",
+            last_name=f"Фамилия{index}"
+        )
+        for index in range(sizes["users"])
+    ), batch_size)
+    user_ids = list(get_users().order_by("id").values_list("id", flat=True))
+    created["follows"] = bulk_create(Follow, (
+        Follow(user_id=user_id, following_id=following_id)
+        for user_id in user_ids
+        for following_id in sample_others(
+            rng,
+            user_ids,
+            user_id,
+            sizes["follows"]
+        )
+    ), batch_size)
+
+    recipe_ids = []
+    created["recipes"] = 0
+    created["ingredients_in_recipes"] = created["tags_in_recipes"] = 0
+    for batch in batched(
+            make_recipes(rng, sizes["recipes"], user_ids),
+            batch_size):
+        recipes = models.Recipe.objects.bulk_create(batch)
+        recipe_ids += [recipe.pk for recipe in recipes]
+        created["recipes"] += len(recipes)
+        created["ingredients_in_recipes"] += bulk_create(
+            models.IngredientInRecipe,
+            (
+                models.IngredientInRecipe(
+                    recipe=recipe,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500)
+                )
+                for recipe in recipes
+                for ingredient_id in sample(
+                    rng,
+                    ingredient_ids,
+                    sizes["ingredients_per_recipe"]
+                )
+            ),
+            batch_size
+        )
+        created["tags_in_recipes"] += bulk_create(
+            models.TagsInRecipe,
+            (
+                models.TagsInRecipe(recipe=recipe, tag_id=tag_id)
+                for recipe in recipes
+                for tag_id in sample(rng, tag_ids, rng.randint(1, 3))
+            ),
+            batch_size
+        )
+
+    for model, name in (
+            (models.Favorite, "favorites"),
+            (models.ShoppingCart, "carts")):
+        created[name] = bulk_create(model, (
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in sample(rng, recipe_ids, sizes[name])
+        ), batch_size)
+
+    counters.reconcile(fix=True, batch_size=batch_size)
+    search.update_vectors(models.Recipe.objects.filter(author__in=user_ids))
+    snapshots.rebuild(recipe_ids, batch_size)
+    response_cache.invalidate()
+    autocomplete.index.invalidate()
+    return created
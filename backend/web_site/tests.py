@@ -0,0 +1,1662 @@
+import base64
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import include, path
+from PIL import Image
+from psycopg2 import extensions
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from foodgram.db import base as db_base
+from foodgram.db.base import ConnectionPool, Database
+from users.models import Follow
+from . import (
+    counters,
+    models,
+    scores,
+    search,
+    serializers,
+    snapshots,
+    viewer
+)
+from .cache import response_cache
+from .fields import StreamingBase64ImageField
+from .metrics import QueryBudgetExceeded
+from .views import RecipeView
+
+
+def create_recipe(author, name="Рецепт", text="Описание"):
+    return models.Recipe.objects.create(
+        author=author,
+        name=name,
+        image="recipe.png",
+        text=text,
+        cooking_time=10
+    )
+
+
+def make_image():
+    buffer = BytesIO()
+    Image.new("RGB", (2, 2)).save(buffer, format="PNG")
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f"data:image/png;base64,{encoded}"
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.User.objects.create_user(
+            username="viewer",
+            email="viewer@example.com",
+            password="password",
+            first_name="Viewer",
+            last_name="Viewer"
+        )
+        cls.tags = [
+            models.Tag.objects.create(
+                name=f"Тэг {index}",
+                color=color,
+                slug=f"tag-{index}"
+            )
+            for index, (color, _) in enumerate(models.Tag.COLOR_CHOICE[:2])
+        ]
+        cls.ingredients = [
+            models.Ingredient.objects.create(
+                name=f"ингредиент {index}",
+                measurement_unit="г"
+            )
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.author_number = 0
+
+    def create_recipes(self, count):
+        for _ in range(count):
+            self.author_number += 1
+            author = models.User.objects.create_user(
+                username=f"author{self.author_number}",
+                email=f"author{self.author_number}@example.com",
+                password="password",
+                first_name="Author",
+                last_name="Author"
+            )
+            Follow.objects.create(user=self.user, following=author)
+            recipe = create_recipe(author)
+            # снимок с тегами и ингредиентами собирается после коммита
+            with self.captureOnCommitCallbacks(execute=True):
+                for tag in self.tags:
+                    models.TagsInRecipe.objects.create(recipe=recipe, tag=tag)
+                for ingredient in self.ingredients:
+                    models.IngredientInRecipe.objects.create(
+                        recipe=recipe,
+                        ingredient=ingredient,
+                        amount=100
+                    )
+            models.Favorite.objects.create(user=self.user, recipe=recipe)
+            models.ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def count_list_queries(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/recipes/", params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data["results"]
+
+    def test_query_count_is_constant(self):
+        self.create_recipes(1)
+        small_page_queries, results = self.count_list_queries()
+        self.assertEqual(len(results), 1)
+        self.create_recipes(5)
+        full_page_queries, results = self.count_list_queries()
+        self.assertEqual(len(results), 6)
+        self.assertEqual(small_page_queries, full_page_queries)
+
+    def test_query_count_with_filters_is_constant(self):
+        params = {
+            "tags": [tag.slug for tag in self.tags],
+            "is_favorited": 1,
+            "is_in_shopping_cart": 1
+        }
+        self.create_recipes(1)
+        small_page_queries, _ = self.count_list_queries(params)
+        self.create_recipes(5)
+        full_page_queries, results = self.count_list_queries(params)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(small_page_queries, full_page_queries)
+
+    def test_flags_and_relations(self):
+        self.create_recipes(1)
+        _, results = self.count_list_queries()
+        recipe = results[0]
+        self.assertTrue(recipe["is_favorited"])
+        self.assertTrue(recipe["is_in_shopping_cart"])
+        self.assertTrue(recipe["author"]["is_subscribed"])
+        self.assertEqual(len(recipe["tags"]), 2)
+        self.assertEqual(
+            [item["name"] for item in recipe["ingredients"]],
+            [ingredient.name for ingredient in self.ingredients]
+        )
+
+
+class RecipeCursorPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = models.User.objects.create_user(
+            username="author",
+            email="author@example.com",
+            password="password",
+            first_name="Author",
+            last_name="Author"
+        )
+        for index in range(7):
+            create_recipe(cls.author, f"Рецепт {index}")
+
+    def setUp(self):
+        response_cache.invalidate()
+
+    def test_pages_are_stable_when_recipes_are_published(self):
+        client = APIClient()
+        response = client.get("/api/recipes/", {"cursor": "", "limit": 3})
+        self.assertNotIn("count", response.data)
+        names = [recipe["name"] for recipe in response.data["results"]]
+        create_recipe(self.author, "Новый рецепт")
+        while response.data["next"]:
+            response = client.get(response.data["next"])
+            names += [recipe["name"] for recipe in response.data["results"]]
+        self.assertEqual(
+            names,
+            [f"Рецепт {index}" for index in range(6, -1, -1)]
+        )
+
+    def test_invalid_cursor(self):
+        response = APIClient().get("/api/recipes/", {"cursor": "abc"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_with_limit(self):
+        response = APIClient().get("/api/recipes/", {"page": 2, "limit": 5})
+        self.assertEqual(response.data["count"], 7)
+        self.assertEqual(len(response.data["results"]), 2)
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class RecipeFeedTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.followed, cls.other = [
+            models.User.objects.create_user(
+                username=name,
+                email=f"{name}@example.com",
+                password="password",
+                first_name=name,
+                last_name=name
+            )
+            for name in ("reader", "followed", "other")
+        ]
+        Follow.objects.create(user=cls.reader, following=cls.followed)
+        for index in range(4):
+            create_recipe(cls.followed, f"Рецепт {index}")
+            create_recipe(cls.other, f"Чужой рецепт {index}")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def get_names(self, params=None):
+        response = self.client.get("/api/recipes/feed/", params or {})
+        self.assertEqual(response.status_code, 200)
+        names = [recipe["name"] for recipe in response.data["results"]]
+        return names, response.data["next"]
+
+    def test_feed_pages_by_cursor(self):
+        names, next_link = self.get_names({"limit": 3})
+        while next_link:
+            response = self.client.get(next_link)
+            names += [recipe["name"] for recipe in response.data["results"]]
+            next_link = response.data["next"]
+        self.assertEqual(
+            names,
+            [f"Рецепт {index}" for index in range(3, -1, -1)]
+        )
+
+    def test_feed_requires_authentication(self):
+        response = APIClient().get("/api/recipes/feed/")
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(FEED_CACHE_TIMEOUT=60)
+    def test_cached_head_is_reset_on_publish_and_follow(self):
+        self.assertEqual(len(self.get_names()[0]), 4)
+        with CaptureQueriesContext(connection) as queries:
+            self.get_names()
+        self.assertFalse(any(
+            "users_follow" in query["sql"]
+            and "web_site_recipe" in query["sql"]
+            for query in queries
+        ))
+        create_recipe(self.followed, "Новый рецепт")
+        create_recipe(self.other, "Новый чужой рецепт")
+        self.assertEqual(self.get_names()[0][0], "Новый рецепт")
+        Follow.objects.create(user=self.reader, following=self.other)
+        names, _ = self.get_names({"limit": 10})
+        self.assertEqual(names[0], "Новый чужой рецепт")
+        self.assertEqual(len(names), 10)
+
+
+class RecipeScoreTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = models.User.objects.create_user(
+            username="author",
+            email="author@example.com",
+            password="password",
+            first_name="Author",
+            last_name="Author"
+        )
+        cls.recipes = [
+            create_recipe(cls.author, f"Рецепт {index}")
+            for index in range(3)
+        ]
+        users = [
+            models.User.objects.create_user(
+                username=f"user{index}",
+                email=f"user{index}@example.com",
+                password="password",
+                first_name="User",
+                last_name="User"
+            )
+            for index in range(3)
+        ]
+        # у первого рецепта больше всего добавлений, но давних, у второго
+        # одно, но свежее
+        for user in users:
+            models.Favorite.objects.create(user=user, recipe=cls.recipes[0])
+        models.ShoppingCart.objects.create(
+            user=users[0],
+            recipe=cls.recipes[0]
+        )
+        models.Favorite.objects.filter(recipe=cls.recipes[0]).update(
+            when_added=timezone.now() - timedelta(days=20)
+        )
+        models.ShoppingCart.objects.update(
+            when_added=timezone.now() - timedelta(days=20)
+        )
+        models.Favorite.objects.create(user=users[0], recipe=cls.recipes[1])
+
+    def setUp(self):
+        response_cache.invalidate()
+
+    def get_ids(self, ordering, **params):
+        response = APIClient().get(
+            "/api/recipes/",
+            {"ordering": ordering, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [recipe["id"] for recipe in response.data["results"]]
+
+    def test_rankings(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        self.assertEqual(scores.compute(), 3)
+        score = models.RecipeScore.objects.get(recipe=first)
+        self.assertEqual(score.popular, 4)
+        self.assertEqual(self.get_ids("popular"), [first, second, third])
+        self.assertEqual(self.get_ids("trending"), [second, first, third])
+
+    def test_cursor_pages(self):
+        call_command("compute_recipe_scores", stdout=StringIO())
+        client = APIClient()
+        response = client.get(
+            "/api/recipes/",
+            {"ordering": "trending", "cursor": "", "limit": 2}
+        )
+        ids = [recipe["id"] for recipe in response.data["results"]]
+        response = client.get(response.data["next"])
+        ids += [recipe["id"] for recipe in response.data["results"]]
+        self.assertIsNone(response.data["next"])
+        self.assertEqual(ids, self.get_ids("trending"))
+
+    def test_compute_resets_only_ranked_lists(self):
+        client = APIClient()
+        for params in ({}, {"ordering": "popular"}):
+            self.assertEqual(
+                client.get("/api/recipes/", params)["X-Cache"],
+                "MISS"
+            )
+        scores.compute()
+        response = client.get("/api/recipes/")
+        self.assertEqual(response["X-Cache"], "HIT")
+        response = client.get("/api/recipes/", {"ordering": "popular"})
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_recipes_without_score_and_unknown_ordering(self):
+        self.assertEqual(self.get_ids("popular"), [])
+        response = APIClient().get("/api/recipes/", {"ordering": "name"})
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.other = models.User.objects.bulk_create(
+            models.User(
+                username=name,
+                email=f"{name}@example.com",
+                first_name=name,
+                last_name=name
+            )
+            for name in ("author", "other")
+        )
+        cls.potato = models.Ingredient.objects.create(
+            name="картофель",
+            measurement_unit="г"
+        )
+        cls.by_name = create_recipe(cls.author, "картофель фри", "")
+        cls.by_text = create_recipe(cls.author, "Гарнир", "картофель")
+        cls.by_ingredient = create_recipe(cls.author, "Суп", "")
+        models.IngredientInRecipe.objects.create(
+            recipe=cls.by_ingredient,
+            ingredient=cls.potato,
+            amount=100
+        )
+        create_recipe(cls.author, "Салат", "")
+        cls.other_author = create_recipe(cls.other, "картофель", "")
+
+    def setUp(self):
+        response_cache.invalidate()
+
+    def get_ids(self, **params):
+        response = APIClient().get("/api/recipes/", params)
+        return [recipe["id"] for recipe in response.data["results"]]
+
+    def test_ranked_by_name_text_and_ingredients(self):
+        self.assertEqual(
+            self.get_ids(search="картофель", author=self.author.id),
+            [self.by_name.id, self.by_text.id, self.by_ingredient.id]
+        )
+
+    def test_cursor_pages_follow_rank(self):
+        client = APIClient()
+        response = client.get("/api/recipes/", {
+            "search": "картофель",
+            "cursor": "",
+            "limit": 2
+        })
+        ids = [recipe["id"] for recipe in response.data["results"]]
+        response = client.get(response.data["next"])
+        ids += [recipe["id"] for recipe in response.data["results"]]
+        self.assertIsNone(response.data["next"])
+        self.assertEqual(ids, self.get_ids(search="картофель"))
+        self.assertEqual(len(ids), 4)
+
+    def test_cursor_pages_through_tied_ranks(self):
+        # ранги ts_rank дробные, на SQLite ранги - точные константы
+        if connection.vendor != "postgresql":
+            self.skipTest("полнотекстовый поиск есть только в PostgreSQL")
+        for _ in range(7):
+            create_recipe(self.author, "Пюре", "картофельное пюре")
+        search.update_vectors(models.Recipe.objects.all())
+        client = APIClient()
+        response = client.get("/api/recipes/", {
+            "search": "пюре",
+            "cursor": "",
+            "limit": 2
+        })
+        ids = [recipe["id"] for recipe in response.data["results"]]
+        while response.data["next"]:
+            response = client.get(response.data["next"])
+            ids += [recipe["id"] for recipe in response.data["results"]]
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(len(set(ids)), 7)
+
+
+class RecipeTagFilterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = models.User.objects.create_user(
+            username="author",
+            email="author@example.com",
+            password="password",
+            first_name="Author",
+            last_name="Author"
+        )
+        cls.breakfast, cls.lunch = models.Tag.objects.bulk_create([
+            models.Tag(
+                name="Завтрак",
+                color=models.Tag.BLUE,
+                slug="breakfast"
+            ),
+            models.Tag(name="Обед", color=models.Tag.RED, slug="lunch"),
+        ])
+        cls.both, cls.breakfast_only, cls.untagged = (
+            create_recipe(author, name)
+            for name in ("Оба", "Завтрак", "Без тегов")
+        )
+        cls.both.tags.set([cls.breakfast, cls.lunch])
+        cls.breakfast_only.tags.set([cls.breakfast])
+
+    def setUp(self):
+        response_cache.invalidate()
+
+    def get_ids(self, **params):
+        response = APIClient().get("/api/recipes/", params)
+        return [recipe["id"] for recipe in response.data["results"]]
+
+    def test_any_tag_without_duplicates(self):
+        self.assertEqual(
+            self.get_ids(tags=["breakfast", "lunch"]),
+            [self.breakfast_only.id, self.both.id]
+        )
+
+    def test_all_tags(self):
+        self.assertEqual(
+            self.get_ids(tags=["breakfast", "lunch"], tags_mode="all"),
+            [self.both.id]
+        )
+
+    def test_unknown_mode(self):
+        response = APIClient().get(
+            "/api/recipes/",
+            {"tags": "breakfast", "tags_mode": "none"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryPlanTest(TestCase):
+    """Ключевые запросы должны идти по индексам. В SQLite план не должен
+    содержать SCAN таблицы без индекса, в PostgreSQL при выключенном
+    enable_seqscan - Seq Scan (если подходящего индекса нет, планировщик
+    всё равно выберет Seq Scan). Страницы ленты, кроме того, должны
+    читаться в порядке индекса, без сортировки."""
+
+    def assert_uses_index(self, queryset, presorted=False):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+            self.assertNotIn("Seq Scan", plan, plan)
+            if presorted:
+                self.assertNotRegex(plan, r"\bSort\b", plan)
+        else:
+            plan = queryset.explain()
+            self.assertNotRegex(plan, r"(?m)\bSCAN \S+$", plan)
+            if presorted:
+                self.assertNotIn("TEMP B-TREE", plan, plan)
+
+    def test_recipe_page(self):
+        self.assert_uses_index(
+            models.Recipe.objects.order_by("-pub_date", "-id")[:6],
+            presorted=True
+        )
+
+    def test_recipes_by_tags(self):
+        self.assert_uses_index(RecipeView.filter_tags(
+            models.Recipe.objects.all(),
+            ["breakfast", "lunch"]
+        )[:6], presorted=True)
+
+    def test_lookups(self):
+        for queryset in (
+            models.Favorite.objects.filter(recipe_id=1, user_id=1),
+            models.ShoppingCart.objects.filter(recipe_id=1, user_id=1),
+            models.TagsInRecipe.objects.filter(recipe_id=1, tag_id=1),
+            models.IngredientInRecipe.objects.filter(recipe_id=1),
+            models.Recipe.objects.filter(author_id=1),
+            Follow.objects.filter(following_id=1),
+        ):
+            with self.subTest(model=queryset.model.__name__):
+                self.assert_uses_index(queryset)
+
+    def test_ingredient_search(self):
+        # в SQLite LIKE без учёта регистра индекс не использует
+        if connection.vendor != "postgresql":
+            self.skipTest("индексы для LIKE есть только в PostgreSQL")
+        for lookup in ("name__istartswith", "name__icontains"):
+            with self.subTest(lookup=lookup):
+                self.assert_uses_index(
+                    models.Ingredient.objects.filter(**{lookup: "кар"})
+                )
+
+
+@override_settings(QUERY_BUDGET_RAISE=True, SERVER_TIMING=True)
+class QueryBudgetTest(TestCase):
+
+    def setUp(self):
+        response_cache.invalidate()
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs("web_site.metrics", "INFO") as logs:
+            response = APIClient().get("/api/recipes/")
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="\d+ queries", serializer;dur=[\d.]+, '
+            r'total;dur=[\d.]+$'
+        )
+        self.assertEqual(logs.records[0].metrics["route"], "recipes-list")
+        self.assertEqual(
+            logs.records[0].metrics["size"],
+            len(response.content)
+        )
+
+    @override_settings(QUERY_BUDGETS={"recipes-list": {"queries": 0}})
+    def test_exceeded_budget_raises_in_tests(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, "queries="):
+            APIClient().get("/api/recipes/")
+
+    @override_settings(
+        QUERY_BUDGETS={"recipes-list": {"queries": 0}},
+        QUERY_BUDGET_RAISE=False
+    )
+    def test_exceeded_budget_is_logged(self):
+        with self.assertLogs("web_site.metrics", "WARNING"):
+            response = APIClient().get("/api/recipes/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_views_without_mixin_are_not_reported(self):
+        response = APIClient().get("/api/tags/")
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_is_opt_in(self):
+        response = APIClient().get("/api/recipes/")
+        self.assertNotIn("Server-Timing", response)
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class TokenAuthQueryBudgetTest(TestCase):
+    """Бюджеты с настоящим заголовком Authorization: запрос токена
+    TokenAuthentication тоже входит в бюджет"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = (
+            models.User.objects.create_user(
+                username=name,
+                email=f"{name}@example.com",
+                password="password",
+                first_name=name,
+                last_name=name
+            )
+            for name in ("cook", "author")
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tags = [
+            models.Tag.objects.create(
+                name=f"Тэг {index}",
+                color=color,
+                slug=f"tag-{index}"
+            )
+            for index, (color, _) in enumerate(models.Tag.COLOR_CHOICE)
+        ]
+        cls.ingredient = models.Ingredient.objects.create(
+            name="мука",
+            measurement_unit="г"
+        )
+        cls.recipe = create_recipe(cls.author)
+        with cls.captureOnCommitCallbacks(execute=True):
+            models.TagsInRecipe.objects.create(
+                recipe=cls.recipe,
+                tag=cls.tags[0]
+            )
+            models.IngredientInRecipe.objects.create(
+                recipe=cls.recipe,
+                ingredient=cls.ingredient,
+                amount=100
+            )
+        Follow.objects.create(user=cls.user, following=cls.author)
+        models.Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+        models.ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token}")
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def test_reads(self):
+        for url in (
+            "/api/recipes/",
+            f"/api/recipes/{self.recipe.pk}/",
+            "/api/recipes/feed/",
+            "/api/users/subscriptions/",
+            "/api/recipes/download_shopping_cart/",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_writes(self):
+        data = {
+            "tags": [tag.pk for tag in self.tags],
+            "ingredients": [{"id": self.ingredient.pk, "amount": 10}],
+            "name": "Рецепт",
+            "image": make_image(),
+            "text": "Описание",
+            "cooking_time": 10
+        }
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post("/api/recipes/", data, format="json")
+            self.assertEqual(response.status_code, 201)
+            response = self.client.patch(
+                f"/api/recipes/{response.data['id']}/",
+                {"tags": [self.tags[0].pk], "cooking_time": 20},
+                format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+
+
+class AsyncUrls:
+    """URLconf с асинхронными вьюхами, как под ASGI"""
+    urlpatterns = [
+        path("api/", include("web_site.async_urls")),
+        path("api/", include("users.urls")),
+        path("api/", include("web_site.urls")),
+    ]
+
+
+@override_settings(
+    ROOT_URLCONF=AsyncUrls,
+    QUERY_BUDGET_RAISE=True,
+    SERVER_TIMING=True
+)
+class AsyncReadViewsTest(TestCase):
+    """Асинхронные вьюхи отдают то же, что синхронные вьюсеты"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = [
+            models.User.objects.create_user(
+                username=name,
+                email=f"{name}@example.com",
+                password="password",
+                first_name=name,
+                last_name=name
+            )
+            for name in ("viewer", "author")
+        ]
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tag = models.Tag.objects.create(
+            name="Обед",
+            color=models.Tag.RED,
+            slug="lunch"
+        )
+        cls.ingredient = models.Ingredient.objects.create(
+            name="картофель",
+            measurement_unit="г"
+        )
+        cls.recipes = []
+        for index in range(3):
+            recipe = create_recipe(cls.author, f"Рецепт {index}")
+            models.TagsInRecipe.objects.create(recipe=recipe, tag=cls.tag)
+            models.IngredientInRecipe.objects.create(
+                recipe=recipe,
+                ingredient=cls.ingredient,
+                amount=100
+            )
+            cls.recipes.append(recipe)
+        models.Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+        Follow.objects.create(user=cls.user, following=cls.author)
+
+    def setUp(self):
+        response_cache.invalidate()
+
+    def get(self, path, data=None, token=None):
+        return async_to_sync(self.request)("get", path, data, token)
+
+    async def request(self, method, path, data=None, token=None, **extra):
+        # методы AsyncClient - обычные функции, возвращающие корутины
+        headers = {"authorization": f"Token {token}"} if token else {}
+        return await getattr(self.async_client, method)(
+            path,
+            data,
+            headers=headers,
+            **extra
+        )
+
+    def get_sync(self, path, data=None, token=None):
+        client = APIClient()
+        if token:
+            client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        return client.get(path, data)
+
+    def assert_same(self, path, data=None, token=None):
+        response = self.get(path, data, token)
+        self.assertEqual(response.status_code, 200)
+        response_cache.invalidate()
+        self.assertEqual(
+            response.json(),
+            self.get_sync(path, data, token).json()
+        )
+        return response
+
+    def test_recipes_match_sync_views(self):
+        self.assert_same("/api/recipes/", {"limit": 2})
+        self.assert_same("/api/recipes/", {"cursor": "", "limit": 2})
+        self.assert_same("/api/recipes/", {"tags": "lunch"}, self.token.key)
+        response = self.assert_same(
+            f"/api/recipes/{self.recipes[0].pk}/",
+            token=self.token.key
+        )
+        self.assertTrue(response.json()["is_favorited"])
+        self.assertTrue(response.json()["author"]["is_subscribed"])
+
+    def test_tags_and_ingredients_match_sync_views(self):
+        self.assert_same("/api/tags/")
+        self.assert_same(f"/api/tags/{self.tag.pk}/")
+        self.assert_same("/api/ingredients/")
+        self.assert_same("/api/ingredients/", {"name": "карт"})
+        self.assert_same(f"/api/ingredients/{self.ingredient.pk}/")
+
+    def test_anonymous_responses_are_cached(self):
+        self.assertEqual(self.get("/api/recipes/")["X-Cache"], "MISS")
+        self.assertEqual(self.get("/api/recipes/")["X-Cache"], "HIT")
+        response = self.get("/api/recipes/", token=self.token.key)
+        self.assertNotIn("X-Cache", response)
+
+    def test_errors(self):
+        self.assertEqual(self.get("/api/recipes/0/").status_code, 404)
+        response = self.get(
+            "/api/recipes/",
+            {"tags": "lunch", "tags_mode": "none"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("tags_mode", response.json())
+        response = self.get("/api/recipes/", token="invalid")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response["WWW-Authenticate"], "Token")
+
+    def test_server_timing(self):
+        response = self.get("/api/recipes/")
+        self.assertIn('queries"', response["Server-Timing"])
+
+    def test_writes_go_to_sync_views(self):
+        response = async_to_sync(self.request)(
+            "post",
+            "/api/tags/",
+            {"name": "Ужин", "color": models.Tag.GREEN, "slug": "dinner"},
+            content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(models.Tag.objects.filter(slug="dinner").exists())
+
+
+class FakeConnection:
+    """Соединение psycopg2 в объёме, нужном ConnectionPool"""
+
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = True
+        self.healthy = True
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+    def execute(self, sql):
+        pass
+
+    @contextmanager
+    def cursor(self):
+        if not self.healthy:
+            raise Database.OperationalError("server closed the connection")
+        yield self
+
+
+class FakePostgresWrapper(db_base.base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        return FakeConnection()
+
+
+class FakePooledWrapper(db_base.DatabaseWrapper, FakePostgresWrapper):
+    """foodgram.db, соединения которого - FakeConnection"""
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def make_pool(self, max_size=2, **options):
+        self.connections = []
+
+        def connect():
+            self.connections.append(FakeConnection())
+            return self.connections[-1]
+
+        return ConnectionPool(connect, max_size, **options)
+
+    def test_released_connection_is_reused(self):
+        pool = self.make_pool()
+        connection, _ = pool.acquire()
+        connection.status = extensions.TRANSACTION_STATUS_INTRANS
+        pool.release(connection)
+        self.assertIs(pool.acquire()[0], connection)
+        self.assertEqual(
+            connection.status,
+            extensions.TRANSACTION_STATUS_IDLE
+        )
+        stats = pool.stats()
+        self.assertEqual((stats["created"], stats["acquired"]), (1, 2))
+        self.assertEqual(stats["in_use"], 1)
+
+    def test_saturated_pool_waits_then_fails(self):
+        pool = self.make_pool(max_size=1, timeout=0.01)
+        pool.acquire()
+        with self.assertLogs("foodgram.db.base", "WARNING"):
+            with self.assertRaises(Database.OperationalError):
+                pool.acquire()
+        stats = pool.stats()
+        self.assertEqual((stats["waited"], stats["timeouts"]), (1, 1))
+        self.assertEqual(stats["peak"], 1)
+
+    def test_unusable_and_stale_connections_are_replaced(self):
+        pool = self.make_pool(max_idle=60)
+        broken, _ = pool.acquire()
+        stale, _ = pool.acquire()
+        pool.release(broken)
+        pool.release(stale)
+        broken.healthy = False
+        pool._idle[-1] = (stale, time.monotonic() - 61)
+        connection, _ = pool.acquire()
+        self.assertNotIn(connection, (broken, stale))
+        self.assertTrue(broken.closed and stale.closed)
+        self.assertEqual(pool.stats()["idle"], 0)
+
+    def test_pools_follow_connection_params(self):
+        wrapper = FakePooledWrapper({
+            **connection.settings_dict,
+            "NAME": "foodgram",
+            "POOL": {"MAX_SIZE": 2},
+            "CONN_HEALTH_CHECKS": False,
+        }, alias="pool_test")
+        self.addCleanup(wrapper.close_pool)
+        wrapper.connection = first = wrapper.get_new_connection(
+            wrapper.get_connection_params()
+        )
+        wrapper._close()
+        # тест-раннер переключает базу: старое соединение не переиспользуется
+        wrapper.settings_dict["NAME"] = "test_foodgram"
+        wrapper.connection = second = wrapper.get_new_connection(
+            wrapper.get_connection_params()
+        )
+        self.assertIsNot(second, first)
+        self.assertEqual(
+            len([key for key in db_base.pools if key[0] == "pool_test"]),
+            2
+        )
+        wrapper.close_pool()
+        self.assertTrue(first.closed)
+        # соединение, взятое до close_pool, при закрытии не возвращается в
+        # удалённый пул
+        wrapper._close()
+        self.assertTrue(second.closed)
+        self.assertFalse(
+            [key for key in db_base.pools if key[0] == "pool_test"]
+        )
+
+
+class ResponseCacheTest(TestCase):
+
+    def setUp(self):
+        response_cache.invalidate()
+        self.tag = models.Tag.objects.create(
+            name="Обед",
+            color=models.Tag.RED,
+            slug="lunch"
+        )
+
+    def test_anonymous_reads_are_cached_until_change(self):
+        client = APIClient()
+        hits = response_cache.stats()["hits"]
+        self.assertEqual(client.get("/api/tags/")["X-Cache"], "MISS")
+        response = client.get("/api/tags/")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.data[0]["slug"], "lunch")
+        self.assertEqual(response_cache.stats()["hits"], hits + 1)
+
+        self.tag.slug = "dinner"
+        self.tag.save()
+        response = client.get("/api/tags/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data[0]["slug"], "dinner")
+
+    def test_author_rename_resets_recipe_responses(self):
+        author = models.User.objects.create_user(
+            username="author",
+            email="author@example.com",
+            password="password",
+            first_name="Author",
+            last_name="Author"
+        )
+        create_recipe(author)
+        client = APIClient()
+        client.get("/api/recipes/")
+        author.first_name = "Автор"
+        author.save(update_fields=["first_name"])
+        response = client.get("/api/recipes/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(
+            response.data["results"][0]["author"]["first_name"],
+            "Автор"
+        )
+
+    def test_query_string_order_does_not_matter(self):
+        client = APIClient()
+        client.get("/api/recipes/?page=1&limit=2")
+        response = client.get("/api/recipes/?limit=2&page=1")
+        self.assertEqual(response["X-Cache"], "HIT")
+
+    def test_authenticated_reads_are_not_cached(self):
+        client = APIClient()
+        client.force_authenticate(models.User.objects.create_user(
+            username="user",
+            email="user@example.com",
+            password="password",
+            first_name="User",
+            last_name="User"
+        ))
+        client.get("/api/tags/")
+        self.assertNotIn("X-Cache", client.get("/api/tags/"))
+
+
+class ConditionalGetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.User.objects.create_user(
+            username="reader",
+            email="reader@example.com",
+            password="password",
+            first_name="Reader",
+            last_name="Reader"
+        )
+        cls.recipe = create_recipe(cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_detail_not_modified(self):
+        url = f"/api/recipes/{self.recipe.id}/"
+        response = self.client.get(url)
+        etag = response["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # ни теги, ни ингредиенты рецепта для ответа 304 не загружаются
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if "inrecipe" in query["sql"]
+        ])
+        response = self.client.get(
+            url,
+            HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+        models.Favorite.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["is_favorited"])
+
+    def test_list_etag_changes_with_recipe(self):
+        etag = self.client.get("/api/recipes/")["ETag"]
+        response = self.client.get("/api/recipes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.patch(
+            f"/api/recipes/{self.recipe.id}/",
+            {"name": "Новое название"},
+            format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/api/recipes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["name"], "Новое название")
+
+    def test_etag_changes_when_related_data_is_renamed(self):
+        tag = models.Tag.objects.create(
+            name="Обед",
+            color=models.Tag.RED,
+            slug="lunch"
+        )
+        models.TagsInRecipe.objects.create(recipe=self.recipe, tag=tag)
+        url = f"/api/recipes/{self.recipe.id}/"
+        detail_etag = self.client.get(url)["ETag"]
+        list_etag = self.client.get("/api/recipes/")["ETag"]
+        tag.name = "Ужин"
+        tag.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["tags"][0]["name"], "Ужин")
+        response = self.client.get(
+            "/api/recipes/",
+            HTTP_IF_NONE_MATCH=list_etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_is_paginated_once_without_if_none_match(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/recipes/")
+        self.assertIn("ETag", response)
+        self.assertEqual(
+            len([
+                query for query in queries.captured_queries
+                if "COUNT(" in query["sql"]
+            ]),
+            1
+        )
+
+
+@override_settings(VIEWER_CACHE_TIMEOUT=60)
+class ViewerCacheTest(TestCase):
+
+    def test_flags_follow_writes(self):
+        user = models.User.objects.create_user(
+            username="viewer",
+            email="viewer@example.com",
+            password="password",
+            first_name="Viewer",
+            last_name="Viewer"
+        )
+        recipe = create_recipe(user)
+        self.assertFalse(viewer.load(user).is_favorited(recipe.pk))
+        with CaptureQueriesContext(connection) as queries:
+            viewer.load(user)
+        self.assertEqual(len(queries), 0)
+        models.Favorite.objects.create(user=user, recipe=recipe)
+        self.assertTrue(viewer.load(user).is_favorited(recipe.pk))
+
+    @override_settings(VIEWER_CACHE_TIMEOUT=0)
+    def test_relations_are_loaded_without_order_by(self):
+        user = models.User.objects.create_user(
+            username="viewer",
+            email="viewer@example.com",
+            password="password",
+            first_name="Viewer",
+            last_name="Viewer"
+        )
+        with CaptureQueriesContext(connection) as queries:
+            viewer.load(user)
+        self.assertEqual(len(queries), 3)
+        for query in queries:
+            self.assertNotIn("ORDER BY", query["sql"])
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class DownloadShoppingCartTest(TestCase):
+    url = "/api/recipes/download_shopping_cart/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.User.objects.create_user(
+            username="buyer",
+            email="buyer@example.com",
+            password="password",
+            first_name="Buyer",
+            last_name="Buyer"
+        )
+        grams = models.Ingredient.objects.create(
+            name="сахар",
+            measurement_unit="г"
+        )
+        spoons = models.Ingredient.objects.create(
+            name="сахар",
+            measurement_unit="ст. л."
+        )
+        cls.recipes = []
+        for amounts in ((100, 1), (50, 2)):
+            recipe = create_recipe(cls.user)
+            for ingredient, amount in zip((grams, spoons), amounts):
+                models.IngredientInRecipe.objects.create(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=amount
+                )
+            models.ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_amounts_grouped_by_name_and_unit(self):
+        queries, response = self.download()
+        self.assertEqual(queries, 1)
+        self.assertEqual(
+            response.content.decode(),
+            "сахар - 150 г\nсахар - 3 ст. л.\n"
+        )
+        self.assertIn("shopping_list.txt", response["Content-Disposition"])
+
+    def test_csv_and_pdf(self):
+        _, response = self.download(format="csv")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(
+            response.content.decode().splitlines(),
+            [
+                "Ингредиент,Количество,Единица измерения",
+                "сахар,150,г",
+                "сахар,3,ст. л.",
+            ]
+        )
+        _, response = self.download(format="pdf")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(response.content.startswith(b"%PDF"))
+        # текст со шрифтом, а не картинка страницы
+        self.assertIn(b"/Font", response.content)
+        self.assertNotIn(b"/Subtype /Image", response.content)
+
+    def test_errors_are_json(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(self.url, {"format": "pdf"})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("detail", response.json())
+
+    @override_settings(SHOPPING_LIST_CACHE_TIMEOUT=0)
+    def test_not_cached_without_shared_cache(self):
+        # значение по умолчанию без REDIS_URL: файл считается каждый раз
+        self.assertEqual(self.download()[0], 1)
+        self.assertEqual(self.download()[0], 1)
+
+    # с REDIS_URL или явным SHOPPING_LIST_CACHE_TIMEOUT
+    @override_settings(SHOPPING_LIST_CACHE_TIMEOUT=60)
+    def test_cached_until_cart_or_recipe_changes(self):
+        self.assertEqual(self.download()[0], 1)
+        self.assertEqual(self.download()[0], 0)
+
+        first, second = self.recipes
+        models.ShoppingCart.objects.filter(recipe=second).delete()
+        queries, response = self.download()
+        self.assertEqual(queries, 1)
+        self.assertEqual(
+            response.content.decode(),
+            "сахар - 100 г\nсахар - 1 ст. л.\n"
+        )
+
+        item = first.recipes.get(amount=100)
+        item.amount = 200
+        item.save()
+        queries, response = self.download()
+        self.assertEqual(queries, 1)
+        self.assertIn("сахар - 200 г", response.content.decode())
+
+
+class IngredientAutocompleteTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ("сахар", "сахарная пудра", "ванильный сахар", "соль"):
+            models.Ingredient.objects.create(name=name, measurement_unit="г")
+
+    def setUp(self):
+        response_cache.invalidate()
+
+    def search(self, **params):
+        response = APIClient().get("/api/ingredients/", params)
+        self.assertEqual(response.status_code, 200)
+        return [item["name"] for item in response.data]
+
+    def test_prefix_matches_before_substring_matches(self):
+        expected = ["сахар", "сахарная пудра", "ванильный сахар"]
+        self.assertEqual(self.search(name="Сах"), expected)
+        with override_settings(INGREDIENT_INDEX_ENABLED=False):
+            self.assertEqual(self.search(name="сах"), expected)
+
+    def test_limit(self):
+        self.assertEqual(self.search(name="сах", limit=1), ["сахар"])
+
+    def test_without_name_returns_all(self):
+        self.assertEqual(len(self.search()), 4)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.assertEqual(self.search(name="соль"), ["соль"])
+        models.Ingredient.objects.create(name="соль морская",
+                                         measurement_unit="г")
+        models.Ingredient.objects.get(name="соль").delete()
+        self.assertEqual(self.search(name="соль"), ["соль морская"])
+
+
+class FillingDbCommandTest(TestCase):
+
+    def import_file(self, name, content):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / name
+            path.write_text(content, encoding="utf-8")
+            call_command("filling_db", path, batch_size=2, stdout=StringIO())
+
+    def test_import_is_normalized_and_idempotent(self):
+        self.import_file(
+            "ingredients.csv",
+            "соль,г\n соль , г \nсахар,г\nмолоко,мл\n"
+        )
+        self.import_file(
+            "ingredients.json",
+            '[{"name": "соль", "measurement_unit": "г"},'
+            ' {"name": "соль", "measurement_unit": "щепотка"}]'
+        )
+        self.assertEqual(
+            sorted(models.Ingredient.objects.values_list(
+                "name",
+                "measurement_unit"
+            )),
+            [("молоко", "мл"), ("сахар", "г"),
+             ("соль", "г"), ("соль", "щепотка")]
+        )
+
+
+class GenerateDataCommandTest(TestCase):
+    sizes = {
+        "users": 5,
+        "follows": 2,
+        "recipes": 12,
+        "ingredients": 20,
+        "ingredients_per_recipe": 3,
+        "tags": 3,
+        "favorites": 4,
+        "carts": 2,
+    }
+
+    def generate(self, *args):
+        call_command(
+            "generate_data",
+            *args,
+            seed=7,
+            batch_size=5,
+            stdout=StringIO(),
+            **self.sizes
+        )
+        return {
+            "recipes": sorted(models.Recipe.objects.values_list(
+                "author__username",
+                "name",
+                "text",
+                "cooking_time",
+                "favorites_count",
+                "in_carts_count"
+            )),
+            "ingredients": sorted(
+                models.IngredientInRecipe.objects.values_list(
+                    "recipe__name",
+                    "ingredient_id",
+                    "amount"
+                )
+            ),
+            "follows": sorted(Follow.objects.values_list(
+                "user__username",
+                "following__username"
+            )),
+        }
+
+    def test_same_seed_gives_same_dataset(self):
+        first = self.generate()
+        self.assertEqual(len(first["recipes"]), 12)
+        self.assertEqual(len(first["ingredients"]), 36)
+        self.assertEqual(len(first["follows"]), 10)
+        self.assertEqual(models.Favorite.objects.count(), 20)
+        # счётчики пересчитаны после bulk_create
+        self.assertEqual(counters.reconcile(fix=False), {
+            "web_site.Recipe": 0,
+            "users.User": 0,
+        })
+        self.assertEqual(self.generate("--clear"), first)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), QUERY_BUDGET_RAISE=True)
+class CreateRecipeTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.User.objects.create_user(
+            username="cook",
+            email="cook@example.com",
+            password="password",
+            first_name="Cook",
+            last_name="Cook"
+        )
+        cls.tags = [
+            models.Tag.objects.create(
+                name=f"Тэг {index}",
+                color=color,
+                slug=f"tag-{index}"
+            )
+            for index, (color, _) in enumerate(models.Tag.COLOR_CHOICE)
+        ]
+        cls.tag = cls.tags[0]
+        cls.ingredients = models.Ingredient.objects.bulk_create(
+            models.Ingredient(name=f"ингредиент {index}", measurement_unit="г")
+            for index in range(25)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_recipe(self, ingredients, tags=None):
+        return self.client.post(
+            "/api/recipes/",
+            {
+                "tags": [tag.id for tag in tags or [self.tag]],
+                "ingredients": ingredients,
+                "name": "Рецепт",
+                "image": make_image(),
+                "text": "Описание",
+                "cooking_time": 10
+            },
+            format="json"
+        )
+
+    def count_create_queries(self, ingredients, tags):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_recipe(
+                [
+                    {"id": ingredient.id, "amount": 10}
+                    for ingredient in ingredients
+                ],
+                tags
+            )
+        self.assertEqual(response.status_code, 201)
+        return len(queries)
+
+    def test_statement_count_does_not_depend_on_ingredients(self):
+        self.assertEqual(
+            self.count_create_queries(self.ingredients[:1], self.tags[:1]),
+            self.count_create_queries(self.ingredients, self.tags)
+        )
+        recipe = models.Recipe.objects.latest("id")
+        self.assertEqual(recipe.recipes.count(), 25)
+        self.assertEqual(
+            set(recipe.tags.values_list("pk", flat=True)),
+            {tag.pk for tag in self.tags}
+        )
+
+    @override_settings(RECIPE_IMAGE_ASYNC=False)
+    def test_image_variants_are_built_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_recipe([
+                {"id": self.ingredients[0].id, "amount": 10}
+            ])
+        self.assertEqual(response.data["image_variants"], {})
+        recipe = models.Recipe.objects.get(pk=response.data["id"])
+        self.assertEqual(
+            set(recipe.image_variants),
+            set(settings.RECIPE_IMAGE_VARIANTS)
+        )
+        response = self.client.get(f"/api/recipes/{recipe.id}/")
+        self.assertTrue(
+            response.data["image_variants"]["thumbnail"].endswith(".webp")
+        )
+
+    def test_unknown_ingredient(self):
+        missing_id = self.ingredients[-1].id + 1
+        response = self.post_recipe([{"id": missing_id, "amount": 10}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.Recipe.objects.exists())
+
+    def test_unknown_tag(self):
+        missing = models.Tag(pk=self.tags[-1].pk + 1)
+        # все теги проверяются одним запросом
+        with self.assertNumQueries(1):
+            response = self.post_recipe(
+                [{"id": self.ingredients[0].id, "amount": 10}],
+                [self.tag, missing]
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(missing.pk), str(response.data))
+        self.assertFalse(models.Recipe.objects.exists())
+
+    def test_partial_update_applies_only_the_diff(self):
+        response = self.post_recipe([
+            {"id": ingredient.id, "amount": 10}
+            for ingredient in self.ingredients[:3]
+        ])
+        recipe = models.Recipe.objects.get(pk=response.data["id"])
+        rows = {
+            row.ingredient_id: row.pk for row in recipe.recipes.all()
+        }
+        url = f"/api/recipes/{recipe.id}/"
+
+        response = self.client.patch(url, {"name": "Новое"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, "Новое")
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.assertEqual(
+            {row.ingredient_id: row.pk for row in recipe.recipes.all()},
+            rows
+        )
+
+        kept, changed, removed = self.ingredients[:3]
+        added = self.ingredients[3]
+        response = self.client.patch(url, {"ingredients": [
+            {"id": kept.id, "amount": 10},
+            {"id": changed.id, "amount": 20},
+            {"id": added.id, "amount": 30},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        current = {row.ingredient_id: row for row in recipe.recipes.all()}
+        self.assertEqual(set(current), {kept.id, changed.id, added.id})
+        self.assertEqual(current[kept.id].pk, rows[kept.id])
+        self.assertEqual(current[changed.id].pk, rows[changed.id])
+        self.assertEqual(current[changed.id].amount, 20)
+        self.assertEqual(current[added.id].amount, 30)
+        self.assertNotIn(removed.id, current)
+
+
+class StreamingBase64ImageFieldTest(SimpleTestCase):
+
+    def setUp(self):
+        self.field = StreamingBase64ImageField()
+        # маленькие куски, чтобы проверить стыки между ними
+        self.field.chunk_size = 8
+
+    def test_decodes_in_chunks(self):
+        image = make_image()
+        header, encoded = image.split(",")
+        # переводы строк внутри base64 допустимы
+        encoded = "\n".join(
+            encoded[index:index + 7] for index in range(0, len(encoded), 7)
+        )
+        file = self.field.to_internal_value(f"{header},{encoded}")
+        self.assertTrue(file.name.endswith(".png"))
+        self.assertEqual(file.content_type, "image/png")
+        self.assertEqual(
+            file.read(),
+            base64.b64decode(image.split(",")[1])
+        )
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=16)
+    def test_rejects_large_payload_before_decoding(self):
+        with self.assertRaisesMessage(ValidationError, "больше 16 байт"):
+            # не base64, но размер проверяется раньше
+            self.field.to_internal_value("!" * 100)
+
+    def test_rejects_unknown_format(self):
+        encoded = base64.b64encode(b"<svg></svg>").decode()
+        with self.assertRaisesMessage(ValidationError, "Поддерживаются"):
+            self.field.to_internal_value(encoded)
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=1000)
+    def test_rejects_too_many_pixels(self):
+        buffer = BytesIO()
+        Image.new("1", (100, 100)).save(buffer, format="PNG")
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+        with self.assertRaisesMessage(ValidationError, "пикселей"):
+            self.field.to_internal_value(encoded)
+
+
+class CountersTest(TestCase):
+
+    def test_counters_follow_writes_and_reconcile(self):
+        author = models.User.objects.create_user(
+            username="author",
+            email="author@example.com",
+            password="password",
+            first_name="Author",
+            last_name="Author"
+        )
+        recipe = create_recipe(author)
+        models.Favorite.objects.create(user=author, recipe=recipe)
+        cart = models.ShoppingCart.objects.create(user=author, recipe=recipe)
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 1)
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.in_carts_count, 1)
+
+        cart.delete()
+        models.Recipe.objects.filter(pk=recipe.pk).update(favorites_count=5)
+        self.assertEqual(counters.reconcile(fix=False)["web_site.Recipe"], 1)
+        counters.reconcile()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.in_carts_count, 0)
+
+        recipe.delete()
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 0)
+
+    def test_drifted_counter_does_not_go_negative(self):
+        author = models.User.objects.create_user(
+            username="author",
+            email="author@example.com",
+            password="password",
+            first_name="Author",
+            last_name="Author"
+        )
+        recipe = create_recipe(author)
+        favorite = models.Favorite.objects.create(user=author, recipe=recipe)
+        models.Recipe.objects.filter(pk=recipe.pk).update(favorites_count=0)
+        favorite.delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+
+class RecipeSnapshotTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = models.User.objects.create_user(
+            username="author",
+            email="author@example.com",
+            password="password",
+            first_name="Author",
+            last_name="Author"
+        )
+        cls.tag = models.Tag.objects.create(
+            name="Завтрак",
+            color=models.Tag.COLOR_CHOICE[0][0],
+            slug="breakfast"
+        )
+        cls.ingredient = models.Ingredient.objects.create(
+            name="мука",
+            measurement_unit="г"
+        )
+        cls.recipe = create_recipe(cls.author)
+        with cls.captureOnCommitCallbacks(execute=True):
+            models.TagsInRecipe.objects.create(recipe=cls.recipe, tag=cls.tag)
+            models.IngredientInRecipe.objects.create(
+                recipe=cls.recipe,
+                ingredient=cls.ingredient,
+                amount=100
+            )
+
+    def get_snapshot(self):
+        return models.RecipeSnapshot.objects.get(recipe=self.recipe).data
+
+    def test_response_matches_serializer(self):
+        response = APIClient().get(f"/api/recipes/{self.recipe.pk}/")
+        self.assertEqual(response.status_code, 200)
+        recipe = snapshots.get_queryset().get(pk=self.recipe.pk)
+        expected = serializers.ShowRecipeSerializer(
+            recipe,
+            context={"request": response.wsgi_request}
+        ).data
+        self.assertEqual(response.json(), expected)
+
+    def test_snapshot_follows_related_changes(self):
+        self.ingredient.name = "мука пшеничная"
+        self.ingredient.save()
+        self.author.first_name = "Автор"
+        self.author.save(update_fields=["first_name"])
+        with self.captureOnCommitCallbacks(execute=True):
+            models.TagsInRecipe.objects.get(recipe=self.recipe).delete()
+        data = self.get_snapshot()
+        self.assertEqual(data["ingredients"][0]["name"], "мука пшеничная")
+        self.assertEqual(data["author"]["first_name"], "Автор")
+        self.assertEqual(data["tags"], [])
+
+    def test_relation_rows_rebuild_snapshot_once_after_commit(self):
+        lunch = models.Tag.objects.create(
+            name="Обед",
+            color=models.Tag.COLOR_CHOICE[1][0],
+            slug="lunch"
+        )
+        sugar = models.Ingredient.objects.create(
+            name="сахар",
+            measurement_unit="г"
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            models.TagsInRecipe.objects.create(recipe=self.recipe, tag=lunch)
+            models.IngredientInRecipe.objects.create(
+                recipe=self.recipe,
+                ingredient=sugar,
+                amount=5
+            )
+        # до коммита снимок прежний
+        self.assertEqual(len(self.get_snapshot()["tags"]), 1)
+        with self.assertNumQueries(4):
+            for callback in callbacks:
+                callback()
+        data = self.get_snapshot()
+        self.assertEqual(len(data["tags"]), 2)
+        self.assertEqual(len(data["ingredients"]), 2)
+
+    def test_command_repairs_missing_and_stale_snapshots(self):
+        models.RecipeSnapshot.objects.filter(recipe=self.recipe).update(
+            data={}
+        )
+        self.assertEqual(snapshots.check(), {"missing": 0, "stale": 1})
+        call_command("recipe_snapshots", "--fix", stdout=StringIO())
+        self.assertEqual(self.get_snapshot()["name"], "Рецепт")
+        models.RecipeSnapshot.objects.all().delete()
+        call_command("recipe_snapshots", stdout=StringIO())
+        self.assertEqual(snapshots.check(), {"missing": 0, "stale": 0})
@@ -0,0 +1,135 @@
+"""Пропускная способность API под WSGI и ASGI при большом числе
+одновременных запросов (команда throughput).
+
+В отличие от сценариев web_site.benchmark, здесь запросы идут по сети к
+настоящему серверу gunicorn: синхронным воркерам с foodgram.wsgi или
+воркерам uvicorn с foodgram.asgi (асинхронные вьюхи web_site.async_views).
+Сервер работает с той же базой, что и команда, поэтому данные должны быть
+в ней закоммичены заранее, например командой generate_data.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+
+from .benchmark import percentile
+
+SERVERS = {
+    "wsgi": ["foodgram.wsgi:application"],
+    "asgi": [
+        "foodgram.asgi:application",
+        "--worker-class",
+        "uvicorn.workers.UvicornWorker",
+    ],
+}
+
+
+def start_server(name, port, workers, response_cache=False):
+    env = {
+        **os.environ,
+        "RESPONSE_CACHE_ENABLED": "1" if response_cache else "0",
+    }
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn.app.wsgiapp",
+            *SERVERS[name],
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=settings.BASE_DIR,
+        env=env
+    )
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Сервер завершился при запуске")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Сервер не открыл порт {port} за {timeout} с")
+
+
+async def fetch(port, path):
+    """Один запрос по отдельному соединению, возвращает код ответа"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: localhost\r\n"
+            "Connection: close\r\n\r\n".encode()
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        while await reader.read(65536):
+            pass
+    finally:
+        writer.close()
+    return int(status_line.split()[1])
+
+
+async def generate_load(port, paths, concurrency, duration):
+    timings = []
+    errors = 0
+
+    async def client(offset):
+        nonlocal errors
+        number = offset
+        while time.monotonic() < deadline:
+            path = paths[number % len(paths)]
+            number += 1
+            start = time.perf_counter()
+            try:
+                status = await fetch(port, path)
+            except (OSError, IndexError, ValueError):
+                status = None
+            if status == 200:
+                timings.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    result = {
+        "requests": len(timings),
+        "errors": errors,
+        "rps": round(len(timings) / elapsed, 1),
+    }
+    if timings:
+        result.update({
+            "p50": round(percentile(timings, 50), 3),
+            "p95": round(percentile(timings, 95), 3),
+            "p99": round(percentile(timings, 99), 3),
+        })
+    return result
+
+
+def run(name, paths, concurrency=64, duration=10, workers=1, port=8765,
+        response_cache=False):
+    """Запускает сервер name, нагружает его и останавливает"""
+    process = start_server(name, port, workers, response_cache)
+    try:
+        wait_for_port(port, process)
+        # прогрев: импорты, соединения с базой, индекс подсказок
+        asyncio.run(generate_load(port, paths, workers, 1))
+        return asyncio.run(
+            generate_load(port, paths, concurrency, duration)
+        )
+    finally:
+        process.terminate()
+        process.wait()
@@ -8,7 +8,9 @@ from .views import (
     RecipeView,
     ShoppingCartViewSet,
     TagView,
-    DownloadShoppingCartView
+    DownloadShoppingCartView,
+    CacheStatsView,
+    DatabaseStatsView
 )
 
 router = DefaultRouter()
@@ -21,5 +23,7 @@ urlpatterns = [
     path("recipes/<int:recipe_id>/favorite/", FavoriteView.as_view()),
     path("recipes/<int:recipe_id>/shopping_cart/", ShoppingCartViewSet.as_view()),
     path("recipes/download_shopping_cart/", DownloadShoppingCartView.as_view(), name="download"),
+    path("cache/stats/", CacheStatsView.as_view(), name="cache-stats"),
+    path("db/stats/", DatabaseStatsView.as_view(), name="db-stats"),
     path("", include(router.urls)),
 ]
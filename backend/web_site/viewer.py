@@ -0,0 +1,84 @@
+"""Связи текущего пользователя для флагов is_favorited,
+is_in_shopping_cart и is_subscribed.
+
+id избранных рецептов, рецептов в списке покупок и авторов, на которых
+подписан пользователь, загружаются один раз за запрос и хранятся в
+frozenset, поэтому флаг любого объекта в ответе проверяется без запроса к
+базе. При VIEWER_CACHE_TIMEOUT > 0 наборы ещё и кэшируются по
+пользователю (в виде массивов int), а изменения Favorite, ShoppingCart и
+Follow сбрасывают этот кэш (web_site.signals).
+"""
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from users.models import Follow
+from . import models
+
+
+class Viewer:
+    def __init__(self, favorite_ids=(), cart_ids=(), following_ids=()):
+        self.favorite_ids = frozenset(favorite_ids)
+        self.cart_ids = frozenset(cart_ids)
+        self.following_ids = frozenset(following_ids)
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self.favorite_ids
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self.cart_ids
+
+    def is_subscribed(self, author_id):
+        return author_id in self.following_ids
+
+
+ANONYMOUS = Viewer()
+
+
+def get_cache_key(user_id):
+    return f"viewer:{user_id}"
+
+
+def load(user):
+    key = get_cache_key(user.pk)
+    timeout = settings.VIEWER_CACHE_TIMEOUT
+    if timeout:
+        cached = cache.get(key)
+        if cached is not None:
+            return Viewer(*cached)
+    # порядок не нужен: id складываются в frozenset, а ORDER BY из
+    # Meta.ordering моделей стоил бы сортировки на каждое чтение
+    relations = (
+        array("q", models.Favorite.objects.filter(
+            user=user
+        ).order_by().values_list("recipe_id", flat=True)),
+        array("q", models.ShoppingCart.objects.filter(
+            user=user
+        ).order_by().values_list("recipe_id", flat=True)),
+        array("q", Follow.objects.filter(
+            user=user
+        ).order_by().values_list("following_id", flat=True)),
+    )
+    if timeout:
+        cache.set(key, relations, timeout)
+    return Viewer(*relations)
+
+
+def get_viewer(request):
+    """Viewer пользователя запроса, загруженный один раз на запрос"""
+    if request is None or not request.user.is_authenticated:
+        return ANONYMOUS
+    viewer = getattr(request, "_viewer", None)
+    if viewer is None:
+        viewer = request._viewer = load(request.user)
+    return viewer
+
+
+def invalidate(user_id):
+    if not settings.VIEWER_CACHE_TIMEOUT:
+        return
+    key = get_cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
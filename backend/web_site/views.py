@@ -1,5 +1,9 @@
-from django.db.models import Q
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import connection
+from django.db.models import (
+    Exists,
+    OuterRef
+)
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import (
@@ -7,28 +11,42 @@ from rest_framework import (
     status
 )
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (
     AllowAny,
+    IsAdminUser,
+    IsAuthenticated,
     IsAuthenticatedOrReadOnly
 )
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from . import (
+    autocomplete,
+    feed,
+    renderers,
+    scores,
+    search,
     serializers,
+    shopping_list,
+    snapshots,
     models
 )
+from .cache import CachedReadMixin, response_cache
+from .conditional import ConditionalGetMixin
+from .metrics import QueryBudgetMixin
+from .pagination import FeedPagination, RecipePagination
+from .viewer import get_viewer
 
 
-class TagView(viewsets.ModelViewSet):
+class TagView(CachedReadMixin, viewsets.ModelViewSet):
     queryset = models.Tag.objects.all()
     serializer_class = serializers.TagSerializers
     permission_classes = [AllowAny, ]
     pagination_class = None
 
 
-class IngredientsView(viewsets.ModelViewSet):
+class IngredientsView(CachedReadMixin, viewsets.ModelViewSet):
     queryset = models.Ingredient.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly, ]
     serializer_class = serializers.IngredientSerializer
@@ -36,19 +54,28 @@ class IngredientsView(viewsets.ModelViewSet):
     search_fields = ["name", ]
     pagination_class = None
 
-    # метод, который выводит ингредиенты по первым буквам
-    def get_queryset(self):
-        name = str(self.request.query_params.get("name"))
-        queryset = self.queryset
+    # подсказки по названию: сначала ингредиенты, название которых
+    # начинается с name, затем те, где name встречается внутри
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name", "").strip()
         if not name:
-            return queryset
-        start_queryset = queryset.filter(name__istartswith=name)
-        return start_queryset
+            return super().list(request, *args, **kwargs)
+        ingredients = autocomplete.search(
+            name,
+            autocomplete.get_limit(request.query_params.get("limit"))
+        )
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
 
 
-class RecipeView(viewsets.ModelViewSet):
+class RecipeView(
+    QueryBudgetMixin,
+    ConditionalGetMixin,
+    CachedReadMixin,
+    viewsets.ModelViewSet
+):
     queryset = models.Recipe.objects.all()
-    pagination_class = PageNumberPagination
+    pagination_class = RecipePagination
     permissions = [IsAuthenticatedOrReadOnly, ]
     filter_backends = [DjangoFilterBackend, ]
 
@@ -58,11 +85,12 @@ class RecipeView(viewsets.ModelViewSet):
         user = self.request.user
         tags = self.request.query_params.getlist('tags')
         author_id = self.request.query_params.get('author')
-        queryset = models.Recipe.objects.all()
+        query = self.get_search_query()
+        queryset = self.get_annotated_queryset(models.Recipe.objects.all())
 
         if is_favorited and is_favorited == "1":
             if user.is_authenticated:
-                queryset = models.Recipe.objects.filter(favorite__user=user)
+                queryset = queryset.filter(favorite__user=user)
 
         if is_in_shopping_cart and is_in_shopping_cart == "1":
             if user.is_authenticated:
@@ -73,17 +101,163 @@ class RecipeView(viewsets.ModelViewSet):
 
         # Фильтруем рецепты по выбранным тегам
         if tags:
-            #  это специальное выражение для фильтрации через связанные поля
-            tag_filter = Q(tags__slug__in=tags)
-            # distinct() для получения уникальных записей
-            queryset = queryset.filter(tag_filter).distinct()
+            queryset = self.filter_tags(
+                queryset,
+                tags,
+                self.get_tags_mode() == "all"
+            )
+
+        # самые релевантные рецепты первыми, при равной релевантности -
+        # более новые
+        if query:
+            queryset = search.search(queryset, query).order_by(
+                *self.get_keyset_ordering()
+            )
+
+        # рейтинги рассчитываются заранее (web_site.scores), рецепты без
+        # рейтинга появятся после следующего расчёта
+        if self.get_ranking():
+            queryset = queryset.filter(
+                score__isnull=False
+            ).select_related("score").order_by(*self.get_keyset_ordering())
         return queryset
 
+    def get_tags_mode(self):
+        mode = self.request.query_params.get("tags_mode", "any")
+        if mode not in ("any", "all"):
+            raise ValidationError(
+                {"tags_mode": "Допустимые значения: any, all"}
+            )
+        return mode
+
+    @staticmethod
+    def filter_tags(queryset, slugs, match_all=False):
+        """Рецепты хотя бы с одним из тегов slugs или, при match_all, со
+        всеми. Условие EXISTS по TagsInRecipe (индекс tag, recipe) не
+        размножает строки рецептов, поэтому DISTINCT не нужен."""
+        def has_tags(*slugs):
+            return Exists(models.TagsInRecipe.objects.filter(
+                recipe=OuterRef("pk"),
+                tag__slug__in=slugs
+            ))
+
+        if not match_all:
+            return queryset.filter(has_tags(*slugs))
+        for slug in dict.fromkeys(slugs):
+            queryset = queryset.filter(has_tags(slug))
+        return queryset
+
+    def get_search_query(self):
+        return self.request.query_params.get("search", "").strip()
+
+    def get_ranking(self):
+        ranking = self.request.query_params.get("ordering")
+        if ranking and ranking not in scores.RANKINGS:
+            raise ValidationError(
+                {"ordering": "Допустимые значения: popular, trending"}
+            )
+        return ranking
+
+    def get_cache_group(self):
+        # пересчёт рейтингов сбрасывает только эти списки
+        if self.get_ranking():
+            return scores.CACHE_GROUP
+        return None
+
+    def get_keyset_ordering(self):
+        ranking = self.get_ranking()
+        if ranking:
+            return (f"-score__{ranking}", "-score__recipe_id")
+        if self.get_search_query():
+            return ("-rank", "-pub_date", "-id")
+        return RecipePagination.ordering
+
+    def get_annotated_queryset(self, queryset):
+        """Представление рецепта берётся из снимка (web_site.snapshots),
+        он присоединяется JOIN, а флаги пользователя берутся из
+        web_site.viewer, поэтому число запросов не зависит от размера
+        страницы."""
+        return queryset.select_related("snapshot")
+
+    def get_validator_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset()).select_related(
+            None
+        ).prefetch_related(None)
+        # снимок пересобирается при любом изменении ответа, в том числе
+        # при переименовании тега, ингредиента или автора
+        queryset = queryset.select_related("snapshot")
+        fields = [
+            "pk",
+            "pub_date",
+            "updated_at",
+            "author_id",
+            "snapshot__built_at",
+        ]
+        ranking = self.get_ranking()
+        if ranking:
+            # рейтинг последнего рецепта нужен курсору следующей страницы
+            queryset = queryset.select_related("score")
+            fields.append(f"score__{ranking}")
+        return queryset.only(*fields)
+
+    def get_last_modified(self, obj):
+        if snapshots.has_snapshot(obj):
+            return obj.snapshot.built_at
+        return obj.updated_at
+
+    def get_validator(self, obj):
+        viewer = get_viewer(self.request)
+        return [
+            obj.pk,
+            self.get_last_modified(obj),
+            viewer.is_favorited(obj.pk),
+            viewer.is_in_shopping_cart(obj.pk),
+            viewer.is_subscribed(obj.author_id),
+        ]
+
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=(IsAuthenticated, ),
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые первыми (web_site.feed).
+        Фильтры и поиск те же, что у списка рецептов."""
+        queryset = feed.get_queryset(
+            self.filter_queryset(self.get_queryset()),
+            request.user
+        )
+        if self.is_feed_head():
+            head = feed.get_head(
+                request.user,
+                queryset,
+                self.get_keyset_ordering()
+            )
+            if head is not None:
+                queryset = self.get_annotated_queryset(
+                    feed.get_head_queryset(head)
+                )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def is_feed_head(self):
+        """Первая страница ленты без фильтров, которая целиком лежит в
+        кэшированной голове"""
+        params = self.request.query_params
+        return (
+            set(params) <= {"limit", FeedPagination.cursor_query_param}
+            and not params.get(FeedPagination.cursor_query_param)
+            and self.paginator.get_page_size(self.request)
+            <= settings.FEED_HEAD_SIZE
+        )
+
     def get_serializer_class(self):
         method = self.request.method
-        if method == "POST" or method == "PATCH":
+        if method in ("POST", "PUT", "PATCH"):
             return serializers.CreateRecipeSerializers
-        return serializers.ShowRecipeSerializer
+        return snapshots.SnapshotSerializer
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -166,33 +340,51 @@ class ShoppingCartViewSet(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class DownloadShoppingCartView(APIView):
+class DownloadShoppingCartView(
+    renderers.FileDownloadMixin,
+    QueryBudgetMixin,
+    APIView
+):
+    """Список покупок в формате txt (по умолчанию), csv или pdf:
+    ?format=csv или заголовок Accept"""
+    permission_classes = [IsAuthenticated, ]
+    renderer_classes = [
+        renderers.TxtRenderer,
+        renderers.CsvRenderer,
+        renderers.PdfRenderer,
+    ]
+    content_negotiation_class = renderers.FileContentNegotiation
 
     def get(self, request):
-        user = request.user
-        shopping_cart = user.shopping_cart.all()
-        buying_list = {}
-        for record in shopping_cart:
-            # для каждой записи получает связанный с ней рецепт
-            recipe = record.recipe
-            ingredients = models.IngredientInRecipe.objects.filter(recipe=recipe)
-            for ingredient in ingredients:
-                amount = ingredient.amount
-                name = ingredient.ingredient.name
-                measurement_unit = ingredient.ingredient.measurement_unit
-                if name not in buying_list:
-                    buying_list[name] = {
-                        "measurement_unit": measurement_unit,
-                        "amount": amount,
-                    }
-                else:
-                    buying_list[name]["amount"] = (
-                            buying_list[name]["amount"] + amount
-                    )
-        wishlist = []
-        for name, data in buying_list.items():
-            wishlist.append(
-                f"{name} - {data['amount']} {data['measurement_unit']}"
-            )
-        response = HttpResponse(wishlist, content_type="text/plain")
+        file_format = request.accepted_renderer.format
+        response = Response(
+            shopping_list.get_file(request.user, file_format)
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping_list.{file_format}"'
+        )
         return response
+
+
+class CacheStatsView(APIView):
+    """Попадания и промахи кэша ответов в этом процессе"""
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request):
+        return Response(response_cache.stats())
+
+
+class DatabaseStatsView(APIView):
+    """Настройки соединений с базой и состояние пула (foodgram.db) в этом
+    процессе"""
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request):
+        get_pool_stats = getattr(connection, "get_pool_stats", None)
+        return Response({
+            "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+            "conn_health_checks": (
+                connection.settings_dict["CONN_HEALTH_CHECKS"]
+            ),
+            "pool": get_pool_stats() if get_pool_stats else None,
+        })